@@ -12,7 +12,13 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 
-from . import operators, renderpanel_ui, properties, preferences
+try:
+    import bpy  # noqa: F401
+except ImportError:
+    # imported by the command line submitter, outside of Blender
+    bpy = None
+else:
+    from . import operators, renderpanel_ui, properties, preferences
 
 
 bl_info = {
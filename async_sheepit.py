@@ -0,0 +1,124 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+from . import sheepit
+
+
+# The background event loop shared by all AsyncSheepit instances
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """ Returns the background event loop, starting it on first use """
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever,
+                                            name="sheepit-loop",
+                                            daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def submit(coroutine):
+    """ Schedules a coroutine on the background event loop
+
+        Returns a concurrent.futures.Future, poll done() from Blender's
+        main thread instead of blocking on result() """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+
+
+def stop_loop():
+    """ Stops the background event loop and waits for its thread """
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            return
+        _loop.call_soon_threadsafe(_loop.stop)
+        _loop_thread.join()
+        _loop.close()
+        _loop = None
+        _loop_thread = None
+
+
+class AsyncSheepit():
+    """ Asyncio counterpart of sheepit.Sheepit
+
+        All coroutines run on the background event loop. The blocking
+        HTTP calls of the wrapped client run in bounded thread pools
+        sharing one connection pool: uploads in one of upload_workers
+        threads, every other call in one of max_workers threads. An
+        upload can take hours, so running uploads only delay further
+        uploads, not logins or status checks. """
+
+    def __init__(self, client=None, max_workers=4, upload_workers=2):
+        self.client = client or sheepit.Sheepit()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sheepit")
+        self._upload_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=upload_workers, thread_name_prefix="sheepit-upload")
+
+    def close(self):
+        """ Shuts down the worker threads, the wrapped client stays open """
+        self._executor.shutdown(wait=False)
+        self._upload_executor.shutdown(wait=False)
+
+    async def _run(self, method, *args, executor=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor or self._executor,
+            functools.partial(method, *args, **kwargs))
+
+    async def login(self, username, password):
+        """ See Sheepit.login() """
+        return await self._run(self.client.login, username, password)
+
+    async def logout(self):
+        """ See Sheepit.logout() """
+        return await self._run(self.client.logout)
+
+    async def is_logged_in(self):
+        """ See Sheepit.is_logged_in() """
+        return await self._run(self.client.is_logged_in)
+
+    async def get_profile_information(self):
+        """ See Sheepit.get_profile_information() """
+        return await self._run(self.client.get_profile_information)
+
+    async def request_upload_token(self):
+        """ See Sheepit.request_upload_token() """
+        return await self._run(self.client.request_upload_token)
+
+    async def upload_file(self, token, path_to_file, callback=None,
+                          cancel=None):
+        """ See Sheepit.upload_file(), callback is called on the upload
+            thread, not on the event loop """
+        return await self._run(self.client.upload_file, token, path_to_file,
+                               callback=callback, cancel=cancel,
+                               executor=self._upload_executor)
+
+    async def get_upload_progress(self, token):
+        """ See Sheepit.get_upload_progress() """
+        return await self._run(self.client.get_upload_progress, token)
+
+    async def add_job(self, token, **settings):
+        """ See Sheepit.add_job() """
+        return await self._run(self.client.add_job, token, **settings)
@@ -0,0 +1,294 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Limits the bandwidth used by uploads
+
+    A token bucket delays the reads of the upload body, so the rest of
+    the network stays usable while a large project is sent. The limit
+    can apply only during some hours of the day, and can adapt to the
+    round trip time: a saturated uplink queues packets, so the round
+    trip time of the upload connection grows and the rate is lowered. """
+
+
+import socket
+import struct
+import threading
+import time
+
+
+MEGABYTE = 1000 * 1000
+
+
+class TokenBucket():
+    """ Hands out bytes at a given rate
+
+        The bucket holds at most burst bytes, or a quarter second of the
+        rate if that is more. Reads larger than the tokens left are let
+        through and paid back by waiting, so the average rate is kept
+        even for large reads and for several threads sharing a bucket. """
+
+    def __init__(self, burst=64 * 1024):
+        self.burst = burst
+        self.tokens = 0.0
+        self._time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount, rate, abort=None):
+        """ Takes amount bytes at rate bytes per second, None or 0 is
+            unlimited
+
+            abort is an optional threading.Event ending the wait early
+            Returns the seconds waited """
+        with self._lock:
+            now = time.monotonic()
+            if rate:
+                capacity = max(self.burst, rate / 4)
+                self.tokens = min(capacity,
+                                  self.tokens + (now - self._time) * rate)
+            self._time = now
+            if not rate:
+                return 0.0
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            delay = -self.tokens / rate
+        if abort is None:
+            time.sleep(delay)
+        else:
+            abort.wait(delay)
+        return delay
+
+
+class Schedule():
+    """ Hours of the day a limit applies, start_hour inclusive,
+        end_hour exclusive, in local time
+
+        A schedule ending before it starts runs over midnight """
+
+    def __init__(self, start_hour, end_hour):
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+
+    def applies(self, when=None):
+        hour = time.localtime(when).tm_hour
+        if self.start_hour <= self.end_hour:
+            return self.start_hour <= hour < self.end_hour
+        return hour >= self.start_hour or hour < self.end_hour
+
+    def __str__(self):
+        return f"{self.start_hour:02d}:00-{self.end_hour:02d}:00"
+
+
+class CongestionControl():
+    """ Lowers the rate while the round trip time is above its minimum
+
+        The lowest round trip time seen is taken as the one of an idle
+        network. If a sample exceeds it by more than target_delay, the
+        rate drops to decrease times the measured throughput, otherwise
+        it grows by increase of the ceiling, or multiplicatively without
+        one until it is no longer limiting. """
+
+    def __init__(self, target_delay=0.1, decrease=0.7, increase=0.05,
+                 floor=32 * 1024):
+        self.target_delay = target_delay
+        self.decrease = decrease
+        self.increase = increase
+        self.floor = floor
+        self.base_rtt = None
+        self.rtt = None
+        # bytes per second, None while not limiting
+        self.rate = None
+
+    def reset(self):
+        self.base_rtt = None
+        self.rtt = None
+        self.rate = None
+
+    def update(self, rtt, throughput, ceiling=None):
+        """ Records a round trip time in seconds and the bytes per second
+            sent since the previous sample
+
+            Returns the new rate """
+        self.rtt = rtt
+        if self.base_rtt is None or rtt < self.base_rtt:
+            self.base_rtt = rtt
+        current = self.rate
+        if ceiling and (current is None or current > ceiling):
+            current = ceiling
+        if rtt - self.base_rtt > self.target_delay:
+            if current is None or current > throughput:
+                current = throughput
+            self.rate = max(self.floor, current * self.decrease)
+        elif current is not None:
+            if ceiling:
+                self.rate = min(ceiling, current + ceiling * self.increase)
+            elif current > 2 * throughput:
+                self.rate = None
+            else:
+                self.rate = current * (1 + self.increase)
+        return self.rate
+
+
+# struct tcp_info of Linux up to tcpi_rtt, in microseconds
+_TCP_INFO = struct.Struct("8B16I")
+
+
+def socket_rtt(sock):
+    """ Returns the smoothed round trip time in seconds the kernel keeps
+        for the connected TCP socket sock, None where TCP_INFO is not
+        available (it is on Linux) """
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO,
+                               _TCP_INFO.size)
+    except OSError:
+        return None
+    if len(info) < _TCP_INFO.size:
+        return None
+    rtt = _TCP_INFO.unpack(info)[-1]
+    return rtt / 1e6 if rtt else None
+
+
+def measure_rtt(address, timeout=5.0):
+    """ Returns the seconds to open a TCP connection to (host, port),
+        None if it failed
+
+        Only an approximation of the round trip time of the upload: the
+        handshake is a single round trip of a new connection, and the
+        name is resolved again for each sample """
+    start = time.monotonic()
+    try:
+        with socket.create_connection(address, timeout):
+            return time.monotonic() - start
+    except OSError:
+        return None
+
+
+class BandwidthLimiter():
+    """ Bandwidth limit shared by all uploads of a client
+
+        limit is in bytes per second, 0 for no fixed limit
+        schedule is an optional Schedule restricting when the limit
+        applies, adaptive enables CongestionControl at all hours
+
+        While an upload runs with adaptive enabled, a thread samples the
+        round trip time to the farm every probe_interval seconds. It is
+        read from the sockets of the uploads where socket_rtt() can, so
+        no probe traffic is sent. Otherwise the time to open a new
+        connection is measured instead, see measure_rtt(). """
+
+    probe_interval = 2.0
+
+    def __init__(self, limit=0, schedule=None, adaptive=False):
+        self.limit = limit
+        self.schedule = schedule
+        self.adaptive = adaptive
+        self.bucket = TokenBucket()
+        self.congestion = CongestionControl()
+        self._lock = threading.Lock()
+        self._uploads = 0
+        self._sockets = []
+        self._stop = None
+        self._bytes = 0
+
+    def configure(self, limit=0, schedule=None, adaptive=False):
+        """ Changes the settings, running uploads use them at once """
+        with self._lock:
+            self.limit = limit
+            self.schedule = schedule
+            if adaptive != self.adaptive:
+                self.congestion.reset()
+            self.adaptive = adaptive
+
+    @property
+    def enabled(self):
+        return bool(self.limit) or self.adaptive
+
+    def _fixed_limit(self):
+        if self.schedule is not None and not self.schedule.applies():
+            return None
+        return self.limit or None
+
+    def current_limit(self):
+        """ Returns the bytes per second uploads are limited to now,
+            None if unlimited """
+        limit = self._fixed_limit()
+        if self.adaptive and self.congestion.rate is not None:
+            if limit is None or self.congestion.rate < limit:
+                limit = self.congestion.rate
+        return limit
+
+    def throttle(self, amount, abort=None):
+        """ Called with the number of bytes read from an upload body,
+            waits as long as the limit requires
+
+            abort is an optional threading.Event ending the wait early """
+        with self._lock:
+            self._bytes += amount
+        return self.bucket.consume(amount, self.current_limit(), abort)
+
+    def start(self, address, sockets=None):
+        """ Called when an upload to (host, port) starts
+
+            sockets is an optional callable returning the connected
+            sockets of the upload, to sample the round trip time from """
+        with self._lock:
+            self._uploads += 1
+            if sockets is not None:
+                self._sockets.append(sockets)
+            if not self.adaptive or self._stop is not None:
+                return
+            self._stop = threading.Event()
+            threading.Thread(target=self._probe, name="sheepit-bandwidth",
+                             args=(address, self._stop), daemon=True).start()
+
+    def stop(self, sockets=None):
+        """ Called when an upload ended, with the sockets given to
+            start() """
+        with self._lock:
+            self._uploads -= 1
+            if sockets is not None:
+                self._sockets.remove(sockets)
+            if self._uploads == 0 and self._stop is not None:
+                self._stop.set()
+                self._stop = None
+
+    def _probe(self, address, stop):
+        last_time = time.monotonic()
+        with self._lock:
+            last_bytes = self._bytes
+        while not stop.wait(self.probe_interval):
+            rtt = self._upload_rtt()
+            if rtt is None:
+                rtt = measure_rtt(address)
+            now = time.monotonic()
+            with self._lock:
+                throughput = (self._bytes - last_bytes) / (now - last_time)
+                last_bytes = self._bytes
+                last_time = now
+                if rtt is None or not self.adaptive:
+                    continue
+                self.congestion.update(rtt, throughput,
+                                       self._fixed_limit())
+
+    def _upload_rtt(self):
+        """ Returns the largest round trip time of the upload sockets,
+            None if none could be read """
+        with self._lock:
+            sources = list(self._sockets)
+        samples = [socket_rtt(sock) for sockets in sources
+                   for sock in sockets()]
+        samples = [rtt for rtt in samples if rtt is not None]
+        return max(samples) if samples else None
@@ -0,0 +1,165 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Upload throughput and callback latency with different read sizes
+
+    Uploads are sent with requests to a loopback HTTP server reading the
+    body at each of --bandwidths MB/s, 0 is unlimited. Each run sends
+    about --seconds of data from a sparse file, like
+    Sheepit.upload_file() does. The policies are:
+
+    8K        the 8192 bytes http.client asks for
+    1M        always one MiB
+    adaptive  encoder.AdaptiveChunkSize
+
+    The callbacks per second and the largest gap between two of them show
+    how quickly progress and cancelling react. The gap includes stalls of
+    TCP itself, the socket buffers hide chunks smaller than them. """
+
+
+import argparse
+import http.server
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import requests
+from .. import bandwidth
+from ..requests_toolbelt.multipart import encoder
+from .encoder_buffer import parse_size
+
+
+POLICIES = ("8K", "1M", "adaptive")
+
+
+class FixedChunkSize():
+    def __init__(self, size):
+        self.size = size
+
+    def next_size(self):
+        return self.size
+
+    def record(self, amount):
+        pass
+
+
+class ThrottledServer(http.server.ThreadingHTTPServer):
+    """ Reads request bodies at rate bytes per second, 0 is unlimited """
+
+    daemon_threads = True
+
+    def __init__(self, rate):
+        self.rate = rate
+        super().__init__(("127.0.0.1", 0), ThrottledHandler)
+
+    def server_bind(self):
+        # a small receive buffer, so the client feels the limit at once
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                               256 * 1024)
+        super().server_bind()
+
+
+class ThrottledHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        bucket = bandwidth.TokenBucket()
+        left = int(self.headers["Content-Length"])
+        while left:
+            data = self.rfile.read(min(left, 64 * 1024))
+            if not data:
+                break
+            left -= len(data)
+            bucket.consume(len(data), self.server.rate)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+
+def upload(url, path, policy):
+    """ Returns the seconds, the number of callbacks, the largest gap
+        between two of them and the last read size """
+    chunk_size = None
+    if policy == "1M":
+        chunk_size = FixedChunkSize(1024 * 1024)
+    elif policy == "adaptive":
+        chunk_size = encoder.AdaptiveChunkSize()
+    gaps = {"last": None, "max": 0.0, "count": 0}
+
+    def callback(monitor):
+        now = time.monotonic()
+        gaps["count"] += 1
+        if gaps["last"] is not None:
+            gaps["max"] = max(gaps["max"], now - gaps["last"])
+        gaps["last"] = now
+
+    with open(path, "rb") as f:
+        form = encoder.MultipartEncoder({
+            "token": "benchmark",
+            "addjob_archive": ("scene.blend", encoder.FileRegionWrapper(f)),
+        })
+        monitor = encoder.MultipartEncoderMonitor(form, callback, chunk_size)
+        start = time.monotonic()
+        r = requests.post(url, data=monitor,
+                          headers={"Content-Type": monitor.content_type})
+        seconds = time.monotonic() - start
+    r.raise_for_status()
+    return (seconds, gaps["count"], gaps["max"],
+            chunk_size.size if chunk_size else 8192)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bandwidths", type=float, nargs="+",
+                        default=[0, 100, 10, 1], metavar="MB/S")
+    parser.add_argument("--seconds", type=float, default=5.0,
+                        help="approximate duration of a limited upload")
+    parser.add_argument("--max-size", type=parse_size, default="4G",
+                        help="upload size without a limit")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES,
+                        default=POLICIES)
+    arguments = parser.parse_args(argv)
+
+    print(f"{'limit MB/s':>10} {'policy':<9}{'MB':>8}{'MB/s':>9}"
+          f"{'calls/s':>9}{'max gap s':>11}{'last read':>11}")
+    for limit in arguments.bandwidths:
+        rate = limit * bandwidth.MEGABYTE
+        size = arguments.max_size
+        if rate:
+            size = min(size, int(rate * arguments.seconds))
+        server = ThrottledServer(rate)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        handle, path = tempfile.mkstemp(suffix=".blend")
+        try:
+            os.ftruncate(handle, size)
+            os.close(handle)
+            for policy in arguments.policies:
+                seconds, calls, gap, last = upload(url, path, policy)
+                print(f"{limit or '-':>10} {policy:<9}{size / 1e6:>8.1f}"
+                      f"{size / seconds / 1e6:>9.1f}{calls / seconds:>9.0f}"
+                      f"{gap:>11.3f}{last:>11}")
+        finally:
+            os.remove(path)
+            server.shutdown()
+            server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Throughput and peak memory of streaming a large upload body
+
+    A sparse file of --size bytes is encoded like Sheepit.upload_file()
+    does and read in --block sized reads, the read size of http.client.
+    Each buffer runs in its own process, so the peak RSS is its own:
+
+    legacy   the previous CustomBytesIO buffer with smart_truncate()
+    chunked  the ChunkedBuffer queue of chunks, read()
+    readinto the ChunkedBuffer, readinto() a reused bytearray
+    region   the ChunkedBuffer with the file in a FileRegionWrapper,
+             as Sheepit.upload_file() sends it """
+
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from ..requests_toolbelt.multipart import encoder
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+MODES = ("legacy", "chunked", "readinto", "region")
+
+
+class LegacyBuffer(encoder.CustomBytesIO):
+    """ The buffer MultipartEncoder used before ChunkedBuffer
+
+        The encoder truncated it once per load, that is before the
+        first append of each load """
+
+    def __init__(self):
+        super().__init__()
+        self._truncated = False
+
+    def __len__(self):
+        # the encoder takes the unread bytes of ChunkedBuffer with len()
+        return self.len
+
+    def append(self, bytes):
+        if not self._truncated:
+            self.smart_truncate()
+            self._truncated = True
+        return super().append(bytes)
+
+    def read(self, size=-1):
+        self._truncated = False
+        return super().read(size)
+
+    def drop_tail(self, amount):
+        position = self.tell()
+        self.seek(-amount, 2)
+        self.truncate()
+        self.seek(position, 0)
+
+
+def parse_size(text):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1:].upper()])
+    return int(text)
+
+
+def peak_rss():
+    """ Returns the peak resident memory of this process in bytes """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on MacOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def stream(path, mode, block):
+    """ Encodes path and reads the whole body
+
+        Returns the number of bytes and the seconds needed """
+    if mode == "legacy":
+        encoder.ChunkedBuffer = LegacyBuffer
+    with open(path, "rb") as f:
+        body = f
+        if mode == "region":
+            body = encoder.FileRegionWrapper(f)
+        form = encoder.MultipartEncoder({
+            "token": "benchmark",
+            "addjob_archive": (os.path.basename(path), body),
+        })
+        total = 0
+        start = time.perf_counter()
+        if mode == "readinto":
+            buffer = bytearray(block)
+            while True:
+                read = form.readinto(buffer)
+                if not read:
+                    break
+                total += read
+        else:
+            while True:
+                data = form.read(block)
+                if not data:
+                    break
+                total += len(data)
+        seconds = time.perf_counter() - start
+    if total != form.len:
+        raise RuntimeError(f"read {total} of {form.len} bytes")
+    return total, seconds
+
+
+def run_child(arguments):
+    total, seconds = stream(arguments.file, arguments.mode, arguments.block)
+    json.dump({"mode": arguments.mode, "bytes": total, "seconds": seconds,
+               "peak_rss": peak_rss()}, sys.stdout)
+
+
+def run_modes(arguments, modes):
+    """ Runs every mode in a new process on one synthetic file
+
+        Returns the results of the modes """
+    handle, path = tempfile.mkstemp(suffix=".blend")
+    try:
+        # sparse, it takes no disk space and reads as zeros
+        os.ftruncate(handle, arguments.size)
+        os.close(handle)
+        results = []
+        for mode in modes:
+            output = subprocess.run(
+                [sys.executable, "-m", __spec__.name, "--file", path,
+                 "--mode", mode, "--block", str(arguments.block)],
+                check=True, stdout=subprocess.PIPE).stdout
+            results.append(json.loads(output))
+        return results
+    finally:
+        os.remove(path)
+
+
+def report(results):
+    print(f"{'mode':<10}{'MB/s':>10}{'seconds':>10}{'peak RSS MB':>14}")
+    for result in results:
+        rate = result["bytes"] / result["seconds"] / 1e6
+        rss = result["peak_rss"]
+        rss = f"{rss / 1e6:.1f}" if rss is not None else "-"
+        print(f"{result['mode']:<10}{rate:>10.1f}"
+              f"{result['seconds']:>10.2f}{rss:>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=parse_size, default="4G",
+                        help="size of the synthetic file, e.g. 512M or 4G")
+    parser.add_argument("--block", type=int, default=8192,
+                        help="bytes per read")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    # used by the process running one mode
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+    if arguments.file:
+        run_child(arguments)
+    else:
+        report(run_modes(arguments, arguments.modes))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Micro-benchmarks of the MultipartEncoder throughput
+
+    Every payload is encoded and read in --block sized reads, the best
+    of --repeat runs is reported:
+
+    fields  many small form fields
+    mixed   a few hundred fields and a 32 MB file
+    file    a single --size file object
+    region  the same file in a FileRegionWrapper """
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from ..requests_toolbelt.multipart import encoder
+from .encoder_buffer import parse_size
+
+
+PAYLOADS = ("fields", "mixed", "file", "region")
+
+FIELD_COUNT = 5000
+FIELD_SIZE = 64
+MIXED_FIELDS = 200
+MIXED_FILE_SIZE = 32 * 1000 * 1000
+
+
+def small_fields(count):
+    return [(f"field{i}", "x" * FIELD_SIZE) for i in range(count)]
+
+
+def synthetic_file(size, sparse=True):
+    """ Returns the path of a new temporary file of size bytes """
+    handle, path = tempfile.mkstemp(suffix=".blend")
+    with os.fdopen(handle, "wb") as f:
+        if sparse:
+            f.truncate(size)
+        else:
+            # random data, so the file isn't all zero pages
+            chunk = os.urandom(1 << 20)
+            for offset in range(0, size, len(chunk)):
+                f.write(chunk[:size - offset])
+    return path
+
+
+def make_fields(payload, path):
+    """ Returns the fields of payload and the files to close """
+    if payload == "fields":
+        return small_fields(FIELD_COUNT), []
+    f = open(path, "rb")
+    if payload == "mixed":
+        return small_fields(MIXED_FIELDS) + [("file", ("scene", f))], [f]
+    if payload == "region":
+        return [("file", ("scene", encoder.FileRegionWrapper(f)))], [f]
+    return [("file", ("scene", f))], [f]
+
+
+def run(payload, path, block):
+    """ Encodes payload once and reads it
+
+        Returns the body size, the number of reads and the seconds """
+    start = time.perf_counter()
+    fields, files = make_fields(payload, path)
+    try:
+        form = encoder.MultipartEncoder(fields)
+        total = reads = 0
+        while True:
+            data = form.read(block)
+            if not data:
+                break
+            total += len(data)
+            reads += 1
+    finally:
+        for f in files:
+            f.close()
+    return total, reads, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=parse_size, default="1G",
+                        help="size of the single file, e.g. 512M or 4G")
+    parser.add_argument("--block", type=int, default=8192,
+                        help="bytes per read")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--payloads", nargs="+", choices=PAYLOADS,
+                        default=PAYLOADS)
+    arguments = parser.parse_args(argv)
+
+    paths = {
+        "mixed": synthetic_file(MIXED_FILE_SIZE, sparse=False),
+        "file": synthetic_file(arguments.size),
+    }
+    paths["region"] = paths["file"]
+    try:
+        print(f"{'payload':<10}{'MB':>10}{'MB/s':>10}{'reads/s':>12}")
+        for payload in arguments.payloads:
+            best = None
+            for _ in range(arguments.repeat):
+                result = run(payload, paths.get(payload), arguments.block)
+                if best is None or result[2] < best[2]:
+                    best = result
+            total, reads, seconds = best
+            print(f"{payload:<10}{total / 1e6:>10.1f}"
+                  f"{total / seconds / 1e6:>10.1f}{reads / seconds:>12.0f}")
+    finally:
+        for path in set(paths.values()):
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
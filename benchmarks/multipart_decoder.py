@@ -0,0 +1,110 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Peak memory of decoding multipart payloads of growing size
+
+    Each payload has a few small fields and one file part of the given
+    size, produced by the MultipartEncoder in --chunk sized pieces. The
+    peak is the largest memory allocated by Python while decoding, as
+    traced by tracemalloc:
+
+    buffered   MultipartDecoder, needs the payload as one bytes object
+    streaming  StreamingMultipartDecoder, parts spooled to disk """
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from ..requests_toolbelt.multipart import encoder, decoder
+from .encoder_buffer import parse_size
+
+
+MODES = ("buffered", "streaming")
+
+
+def payload(path, chunk):
+    """ Returns the Content-Type and an iterator of the encoded file """
+    f = open(path, "rb")
+    form = encoder.MultipartEncoder([
+        ("token", "benchmark"),
+        ("mode", "add"),
+        ("archive", ("scene.blend", encoder.FileRegionWrapper(f))),
+    ])
+
+    def pieces():
+        with f:
+            while True:
+                data = form.read(chunk)
+                if not data:
+                    return
+                yield bytes(data)
+
+    return form.content_type, pieces()
+
+
+def decode(path, mode, chunk):
+    """ Returns the decoded bytes, the seconds and the peak bytes """
+    content_type, pieces = payload(path, chunk)
+    tracemalloc.start()
+    start = time.perf_counter()
+    total = 0
+    if mode == "buffered":
+        parts = decoder.MultipartDecoder(b"".join(pieces), content_type)
+        for part in parts.parts:
+            total += len(part.content)
+    else:
+        for part in decoder.StreamingMultipartDecoder(pieces, content_type):
+            while True:
+                data = part.read(chunk)
+                if not data:
+                    break
+                total += len(data)
+            part.close()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return total, seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=parse_size, nargs="+",
+                        default=[parse_size(size) for size in
+                                 ("16M", "64M", "256M")])
+    parser.add_argument("--chunk", type=int, default=64 * 1024,
+                        help="bytes per piece of the payload")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    arguments = parser.parse_args(argv)
+
+    print(f"{'mode':<10}{'size MB':>9}{'MB/s':>9}{'peak MB':>9}")
+    for size in arguments.sizes:
+        handle, path = tempfile.mkstemp(suffix=".blend")
+        try:
+            # sparse, it takes no disk space and reads as zeros
+            os.ftruncate(handle, size)
+            os.close(handle)
+            for mode in arguments.modes:
+                total, seconds, peak = decode(path, mode, arguments.chunk)
+                print(f"{mode:<10}{size / 1e6:>9.1f}"
+                      f"{total / seconds / 1e6:>9.1f}{peak / 1e6:>9.1f}")
+        finally:
+            os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,453 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Reads information from .blend files without starting Blender
+
+    The file is memory mapped (compressed files are first decompressed
+    to a temporary file) and only the file-block headers are walked.
+    The SDNA, the description of all structs in the file, is only parsed
+    when struct fields are read.
+
+    Usage:
+        with BlendFile("scene.blend") as blend:
+            summary = blend.summary()
+
+    or from the command line: python blend_scanner.py scene.blend """
+
+
+import gzip
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Format characters of the DNA base types
+BASE_TYPES = {
+    "char": "b", "uchar": "B", "short": "h", "ushort": "H",
+    "int": "i", "uint": "I", "float": "f", "double": "d",
+    "int8_t": "b", "uint8_t": "B", "int16_t": "h", "uint16_t": "H",
+    "int32_t": "i", "uint32_t": "I", "int64_t": "q", "uint64_t": "Q",
+    "long": "i", "ulong": "I",
+}
+
+# ID types with a path to an external file: (struct, path fields)
+EXTERNAL_FILE_TYPES = {
+    b"IM": ("Image", ("filepath", "name")),
+    b"LI": ("Library", ("filepath", "name")),
+    b"MC": ("MovieClip", ("filepath", "name")),
+    b"SO": ("bSound", ("filepath", "name")),
+    b"VF": ("VFont", ("filepath", "name")),
+    b"CF": ("CacheFile", ("filepath",)),
+    b"VO": ("Volume", ("filepath",)),
+}
+
+# Fields of Scene.r (RenderData) reported by summary()
+RENDER_FIELDS = {
+    "frame_current": "cfra",
+    "frame_start": "sfra",
+    "frame_end": "efra",
+    "frame_step": "frame_step",
+    "fps": "frs_sec",
+    "fps_base": "frs_sec_base",
+    "resolution_x": "xsch",
+    "resolution_y": "ysch",
+    "resolution_percentage": "size",
+    "engine": "engine",
+}
+
+
+class ScanException(Exception):
+    pass
+
+
+class Block():
+    """ Header of one file-block, offset points to its data """
+    __slots__ = ("code", "size", "old", "sdna_index", "count", "offset")
+
+    def __init__(self, code, size, old, sdna_index, count, offset):
+        self.code = code
+        self.size = size
+        self.old = old
+        self.sdna_index = sdna_index
+        self.count = count
+        self.offset = offset
+
+    @property
+    def is_id(self):
+        """ Blocks of datablocks (IDs) use the two letter ID code """
+        return self.code[2:] == b"\0\0" and self.code[:2].isalpha()
+
+    def __repr__(self):
+        return f"<Block {self.code!r} {self.size} bytes>"
+
+
+class Field():
+    __slots__ = ("name", "type", "offset", "size", "pointer", "length")
+
+    def __init__(self, name, type, offset, size, pointer, length):
+        self.name = name
+        self.type = type
+        self.offset = offset
+        self.size = size
+        self.pointer = pointer
+        # number of array elements
+        self.length = length
+
+
+class SDNA():
+    """ The struct descriptions stored in the DNA1 block """
+
+    def __init__(self, data, pointer_size, endian):
+        self.pointer_size = pointer_size
+        self.endian = endian
+        position = 0
+
+        def expect(tag):
+            nonlocal position
+            position = (position + 3) & ~3
+            if data[position:position + 4] != tag:
+                raise ScanException(f"Invalid SDNA, missing {tag!r}")
+            position += 4
+
+        def read_int(format):
+            nonlocal position
+            value = struct.unpack_from(endian + format, data, position)[0]
+            position += struct.calcsize(format)
+            return value
+
+        def read_strings(count):
+            nonlocal position
+            strings = []
+            for i in range(count):
+                end = data.find(b"\0", position)
+                strings.append(data[position:end].decode(
+                    "utf-8", "replace"))
+                position = end + 1
+            return strings
+
+        expect(b"SDNA")
+        expect(b"NAME")
+        names = read_strings(read_int("i"))
+        expect(b"TYPE")
+        self.types = read_strings(read_int("i"))
+        self._type_index = {name: i for i, name in enumerate(self.types)}
+        expect(b"TLEN")
+        self.type_lengths = [read_int("h") & 0xFFFF for _ in self.types]
+        expect(b"STRC")
+        # raw struct definitions, fields are only resolved on access
+        self._raw_structs = []
+        self._struct_index = dict()
+        for i in range(read_int("i")):
+            type_index = read_int("h")
+            fields = [(read_int("h"), read_int("h"))
+                      for _ in range(read_int("h"))]
+            self._raw_structs.append((type_index, fields))
+            self._struct_index[self.types[type_index]] = i
+        self._names = names
+        self._structs = dict()
+
+    def struct_name(self, index):
+        return self.types[self._raw_structs[index][0]]
+
+    def struct(self, name):
+        """ Returns a dict of the fields of the struct name """
+        if name not in self._structs:
+            if name not in self._struct_index:
+                raise ScanException(f"Unknown struct {name}")
+            type_index, raw_fields = \
+                self._raw_structs[self._struct_index[name]]
+            fields = dict()
+            offset = 0
+            for field_type, field_name in raw_fields:
+                field = self._field(self.types[field_type],
+                                    self._names[field_name], offset)
+                fields[field.name] = field
+                offset += field.size
+            self._structs[name] = fields
+        return self._structs[name]
+
+    def _field(self, type, name, offset):
+        pointer = name.startswith("*") or name.startswith("(*")
+        length = 1
+        base = name
+        if "[" in name:
+            base = name[:name.index("[")]
+            for dimension in name[name.index("["):].split("]")[:-1]:
+                length *= int(dimension.lstrip("["))
+        base = base.strip("*()")
+        if pointer:
+            element_size = self.pointer_size
+        else:
+            element_size = self.type_lengths[self._type_index[type]]
+        return Field(base, type, offset, element_size * length,
+                     pointer, length)
+
+
+class BlendFile():
+    """ Memory mapped .blend file """
+
+    def __init__(self, path):
+        self.path = path
+        self.compression = None
+        self._temp_file = None
+        self._file = open(path, "rb")
+        magic = self._file.read(4)
+        self._file.seek(0)
+        if magic[:2] == GZIP_MAGIC:
+            self.compression = "gzip"
+            self._decompress(gzip.GzipFile(fileobj=self._file))
+        elif magic == ZSTD_MAGIC:
+            if zstandard is None:
+                self.close()
+                raise ScanException("zstandard is required for this file")
+            self.compression = "zstd"
+            self._decompress(
+                zstandard.ZstdDecompressor().stream_reader(self._file))
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self.close()
+            raise ScanException("Empty file")
+        try:
+            self._read_header()
+        except ScanException:
+            self.close()
+            raise
+        self._sdna = None
+        self._blocks = None
+
+    def _decompress(self, stream):
+        """ Decompresses to a temporary file, so it can be mapped """
+        self._temp_file = tempfile.TemporaryFile()
+        with stream:
+            shutil.copyfileobj(stream, self._temp_file, 1024 * 1024)
+        self._file.close()
+        self._file = self._temp_file
+        self._file.seek(0)
+
+    def _read_header(self):
+        header = bytes(self.data[:17])
+        if not header.startswith(b"BLENDER"):
+            raise ScanException("Not a blend file")
+        if header[7:9].isdigit():
+            # BLENDER17-01v0500: header size, format version, version
+            self.header_size = int(header[7:9])
+            self.format_version = int(header[10:12])
+            self.pointer_size = 8
+            self.endian = "<" if header[12:13] == b"v" else ">"
+            self.version = int(header[13:17])
+        else:
+            # BLENDER-v300: pointer size, endianness, version
+            self.header_size = 12
+            self.format_version = 0
+            self.pointer_size = 8 if header[7:8] == b"-" else 4
+            self.endian = "<" if header[8:9] == b"v" else ">"
+            self.version = int(header[9:12])
+        if self.format_version == 0:
+            pointer = "Q" if self.pointer_size == 8 else "I"
+            self._bhead = struct.Struct(f"{self.endian}4si{pointer}ii")
+        elif self.format_version == 1:
+            self._bhead = struct.Struct(f"{self.endian}4siQqq")
+        else:
+            raise ScanException(
+                f"Unsupported file format version {self.format_version}")
+
+    def close(self):
+        if getattr(self, "data", None) is not None:
+            self.data.close()
+            self.data = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def blocks(self):
+        """ Iterates over the headers of all file-blocks """
+        if self._blocks is not None:
+            yield from self._blocks
+            return
+        blocks = []
+        position = self.header_size
+        length = len(self.data)
+        while position + self._bhead.size <= length:
+            values = self._bhead.unpack_from(self.data, position)
+            if self.format_version == 0:
+                code, size, old, sdna_index, count = values
+            else:
+                code, sdna_index, old, size, count = values
+            position += self._bhead.size
+            block = Block(code, size, old, sdna_index, count, position)
+            if code == b"ENDB":
+                break
+            blocks.append(block)
+            yield block
+            position += size
+        self._blocks = blocks
+
+    @property
+    def sdna(self):
+        if self._sdna is None:
+            for block in self.blocks():
+                if block.code == b"DNA1":
+                    data = self.data[block.offset:block.offset + block.size]
+                    self._sdna = SDNA(data, self.pointer_size, self.endian)
+                    break
+            else:
+                raise ScanException("No SDNA in file")
+        return self._sdna
+
+    def get(self, block, *path):
+        """ Reads a field of the struct stored in block
+
+            path names the field, nested structs are descended into:
+            get(scene_block, "r", "sfra") """
+        struct_name = self.sdna.struct_name(block.sdna_index)
+        offset = block.offset
+        for i, name in enumerate(path):
+            fields = self.sdna.struct(struct_name)
+            if name not in fields:
+                raise ScanException(f"{struct_name} has no field {name}")
+            field = fields[name]
+            offset += field.offset
+            struct_name = field.type
+        return self._read(field, offset)
+
+    def has_field(self, block, name):
+        struct_name = self.sdna.struct_name(block.sdna_index)
+        return name in self.sdna.struct(struct_name)
+
+    def _read(self, field, offset):
+        if field.pointer:
+            format = "Q" if self.pointer_size == 8 else "I"
+        elif field.type in BASE_TYPES:
+            format = BASE_TYPES[field.type]
+        else:
+            # nested struct, return the raw bytes
+            return bytes(self.data[offset:offset + field.size])
+        if field.type == "char" and field.length > 1 and not field.pointer:
+            raw = self.data[offset:offset + field.size]
+            return raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+        values = struct.unpack_from(
+            f"{self.endian}{field.length}{format}", self.data, offset)
+        return values[0] if field.length == 1 else list(values)
+
+    def id_name(self, block):
+        """ Returns the name of the datablock without the type prefix """
+        name = self.get(block, "id", "name")
+        return name[2:]
+
+    def summary(self):
+        """ Returns a dict with datablock counts, per type byte sizes,
+            external files, the render settings of all scenes and
+            the name of the active scene """
+        counts = dict()
+        sizes = dict()
+        external_files = []
+        scenes = []
+        active_scene = None
+        current_type = "none"
+        for block in self.blocks():
+            if block.is_id:
+                current_type = block.code[:2].decode("ascii")
+                counts[current_type] = counts.get(current_type, 0) + 1
+                if block.code[:2] in EXTERNAL_FILE_TYPES:
+                    external_files.append(self._external_file(block))
+                elif block.code == b"SC\0\0":
+                    scenes.append((self._scene(block), block.old))
+            elif block.code in (b"DNA1", b"GLOB", b"REND", b"TEST"):
+                current_type = block.code.decode("ascii")
+                if block.code == b"GLOB":
+                    active_scene = self._active_scene_pointer(block)
+            # data blocks belong to the datablock written before them
+            sizes[current_type] = sizes.get(current_type, 0) + block.size
+        return {
+            "path": self.path,
+            "version": self.version,
+            "compression": self.compression,
+            "file_size": os.path.getsize(self.path),
+            "datablocks": counts,
+            "sizes": sizes,
+            "external_files": external_files,
+            "scenes": [scene for scene, _ in scenes],
+            "active_scene": next((scene["name"] for scene, old in scenes
+                                  if old == active_scene), None),
+        }
+
+    def _active_scene_pointer(self, block):
+        try:
+            return self.get(block, "curscene")
+        except ScanException:
+            return None
+
+    def _external_file(self, block):
+        code = block.code[:2]
+        _, path_fields = EXTERNAL_FILE_TYPES[code]
+        path = ""
+        for field in path_fields:
+            if self.has_field(block, field):
+                path = self.get(block, field)
+                break
+        packed = False
+        for field in ("packedfile", "packedfiles"):
+            if self.has_field(block, field):
+                value = self.get(block, field)
+                packed = bool(value) if not isinstance(value, bytes) \
+                    else any(value)
+        return {
+            "type": code.decode("ascii"),
+            "name": self.id_name(block),
+            "path": path,
+            "packed": packed,
+        }
+
+    def _scene(self, block):
+        scene = {"name": self.id_name(block)}
+        for key, field in RENDER_FIELDS.items():
+            try:
+                scene[key] = self.get(block, "r", field)
+            except ScanException:
+                pass
+        try:
+            scene["eevee_samples"] = self.get(
+                block, "eevee", "taa_render_samples")
+        except ScanException:
+            pass
+        return scene
+
+
+def scan(path):
+    """ Returns BlendFile.summary() of the file at path """
+    with BlendFile(path) as blend:
+        return blend.summary()
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(json.dumps(scan(path), indent=2))
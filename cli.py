@@ -0,0 +1,302 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Command line batch submitter, usable without a Blender GUI
+
+    python -m <addon directory> --blender /path/to/blender shots/*.blend
+
+    Every file is prepared by a background Blender process, at most
+    --prepare-jobs at a time, and uploaded with at most --upload-jobs
+    concurrent uploads. One JSON object per file is printed to stdout. """
+
+
+import argparse
+import concurrent.futures
+import getpass
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from . import sheepit, worker, blend_scanner, bandwidth
+
+
+def parse_hours(text):
+    """ Returns the bandwidth.Schedule of a START-END argument """
+    start, _, end = text.partition("-")
+    try:
+        start, end = int(start), int(end)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected START-END hours, for example 9-18, not {text!r}")
+    if not (0 <= start <= 23 and 0 <= end <= 24):
+        raise argparse.ArgumentTypeError(
+            f"hours must be between 0 and 24, not {text!r}")
+    return bandwidth.Schedule(start, end)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="sheepit",
+        description="Prepare and submit .blend files to the "
+        "SheepIt! Renderfarm")
+    parser.add_argument("files", nargs="+",
+                        help=".blend files or glob patterns")
+    parser.add_argument("--blender", required=True,
+                        help="path of the Blender executable")
+    parser.add_argument("--username",
+                        help="SheepIt username, the password is read from "
+                        "SHEEPIT_PASSWORD or asked for")
+    parser.add_argument("--cookies",
+                        help="JSON file with a saved session, "
+                        "updated after logging in")
+    parser.add_argument("--server",
+                        default="https://www.sheepit-renderfarm.com",
+                        help="address of the Renderfarm")
+    parser.add_argument("--prepare-jobs", type=int,
+                        default=max(1, (os.cpu_count() or 2) // 2),
+                        help="parallel Blender processes")
+    parser.add_argument("--upload-jobs", type=int, default=2,
+                        help="parallel uploads")
+    parser.add_argument("--slot-wait", type=float, default=3600,
+                        help="seconds to wait for a free project slot")
+    parser.add_argument("--connect-timeout", type=float,
+                        default=sheepit.Sheepit.connect_timeout,
+                        help="seconds to open a connection for an upload")
+    parser.add_argument("--read-timeout", type=float,
+                        default=sheepit.Sheepit.read_timeout,
+                        help="seconds to wait for the response to an upload")
+    parser.add_argument("--stall-timeout", type=float,
+                        default=sheepit.Sheepit.stall_timeout,
+                        help="restart uploads sending nothing for this long")
+    parser.add_argument("--limit", type=float, default=0, metavar="MB/S",
+                        help="maximum upload speed of all uploads together")
+    parser.add_argument("--limit-hours", type=parse_hours, metavar="START-END",
+                        help="apply --limit only between these hours, "
+                        "for example 9-18")
+    parser.add_argument("--adaptive-limit", action="store_true",
+                        help="lower the upload speed when the round trip "
+                        "time to the farm rises")
+
+    job = parser.add_argument_group("job settings")
+    job.add_argument("--frames",
+                     help="frame range START-END, "
+                     "default is the range of the active scene")
+    job.add_argument("--step", type=int, help="frame step")
+    job.add_argument("--still", type=int, metavar="FRAME",
+                     help="render only this frame")
+    job.add_argument("--no-cpu", action="store_true")
+    job.add_argument("--cuda", action="store_true")
+    job.add_argument("--opencl", action="store_true")
+    job.add_argument("--private", action="store_true",
+                     help="only renderable by yourself")
+    job.add_argument("--mp4", action="store_true")
+    job.add_argument("--split-tiles", default="1",
+                     choices=["1", "2", "4", "5", "6"])
+    job.add_argument("--split-layers", type=int,
+                     help="split each frame into layers (Cycles)")
+    return parser.parse_args(argv)
+
+
+def expand_files(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            path = os.path.abspath(path)
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def job_settings(arguments, filepath):
+    """ Returns the keyword arguments for Sheepit.add_job()
+
+        The frame range is read from the active scene of filepath
+        unless given on the command line """
+    scene = dict()
+    summary = blend_scanner.scan(filepath)
+    for candidate in summary["scenes"]:
+        if candidate["name"] == summary["active_scene"]:
+            scene = candidate
+    start, end = scene.get("frame_start", 1), scene.get("frame_end", 1)
+    if arguments.frames:
+        start, _, end = arguments.frames.partition("-")
+        start, end = int(start), int(end or start)
+    return {
+        "animation": arguments.still is None,
+        "cpu": not arguments.no_cpu,
+        "cuda": arguments.cuda,
+        "opencl": arguments.opencl,
+        "public": not arguments.private,
+        "mp4": arguments.mp4,
+        "anim_start_frame": start,
+        "anim_end_frame": end,
+        "anim_step_frame": arguments.step or scene.get("frame_step", 1),
+        "still_frame": arguments.still,
+        "max_ram": "",
+        "split_by_layers": arguments.split_layers is not None,
+        "split_layers": arguments.split_layers,
+        "split_tiles": arguments.split_tiles,
+    }
+
+
+def login(arguments):
+    server = urllib.parse.urlsplit(arguments.server)
+    session = sheepit.Sheepit(server.hostname, server.scheme or "https",
+                              server.port)
+    session.connect_timeout = arguments.connect_timeout
+    session.read_timeout = arguments.read_timeout
+    session.stall_timeout = arguments.stall_timeout
+    session.bandwidth = bandwidth.BandwidthLimiter(
+        arguments.limit * bandwidth.MEGABYTE, arguments.limit_hours,
+        arguments.adaptive_limit)
+    if arguments.cookies and os.path.isfile(arguments.cookies):
+        with open(arguments.cookies, "r") as f:
+            session.import_session(json.load(f))
+        if session.is_logged_in():
+            return session
+    if not arguments.username:
+        raise sheepit.LoginException("Not logged in, use --username")
+    password = os.environ.get("SHEEPIT_PASSWORD") or getpass.getpass()
+    session.login(arguments.username, password)
+    if arguments.cookies:
+        with open(arguments.cookies, "w") as f:
+            json.dump(session.export_session(), f)
+    return session
+
+
+def request_token(session, slot_wait):
+    """ Requests a token, waiting for a free project slot """
+    policy = sheepit.RetryPolicy(attempts=0, base=15, cap=300)
+    deadline = time.monotonic() + slot_wait
+    attempt = 0
+    while True:
+        try:
+            return session.request_upload_token()
+        except sheepit.UploadException:
+            delay = policy.delay(attempt)
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+class BatchSubmitter():
+    """ Prepares and uploads files with bounded parallelism """
+
+    def __init__(self, arguments, session, output=sys.stdout):
+        self.arguments = arguments
+        self.session = session
+        self.output = output
+        self.directory = tempfile.mkdtemp(prefix="sheepit-")
+        self._print_lock = threading.Lock()
+        self._prepare_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=arguments.prepare_jobs,
+            thread_name_prefix="prepare")
+        self._upload_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=arguments.upload_jobs,
+            thread_name_prefix="upload")
+
+    def run(self, files):
+        """ Returns the number of failed files """
+        uploads = []
+        prepares = [self._prepare_pool.submit(self.prepare, path, uploads)
+                    for path in files]
+        concurrent.futures.wait(prepares)
+        # all uploads are submitted once every prepare is done
+        results = [future.result() for future in prepares]
+        results += [future.result() for future in uploads]
+        self._prepare_pool.shutdown()
+        self._upload_pool.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return sum(1 for result in results if result is False)
+
+    def report(self, result):
+        with self._print_lock:
+            self.output.write(json.dumps(result) + "\n")
+            self.output.flush()
+
+    def prepare(self, path, uploads):
+        result = {"file": path, "ok": False, "stage": "prepare"}
+        start = time.monotonic()
+        try:
+            settings = job_settings(self.arguments, path)
+            # prepare_scene.py saves over the file, so work on a copy
+            copy = os.path.join(tempfile.mkdtemp(dir=self.directory),
+                                os.path.basename(path))
+            shutil.copyfile(path, copy)
+        except (OSError, ValueError, blend_scanner.ScanException) as e:
+            result["error"] = str(e)
+            self.report(result)
+            return False
+        # stdout is reserved for the results
+        # relative paths of the copy are resolved from the source file
+        prepared = worker.prepare_in_subprocess(
+            self.arguments.blender, copy, stdout=sys.stderr,
+            directory=os.path.dirname(os.path.abspath(path)))
+        result["prepare_seconds"] = time.monotonic() - start
+        if not prepared["ok"]:
+            result["error"] = prepared["error"]
+            self.report(result)
+            return False
+        if prepared.get("max_ram"):
+            settings["max_ram"] = worker.max_ram_setting(prepared)
+            result["max_ram"] = settings["max_ram"]
+        uploads.append(self._upload_pool.submit(
+            self.upload, copy, settings, result))
+        return None
+
+    def upload(self, copy, settings, result):
+        start = time.monotonic()
+        try:
+            result["stage"] = "token"
+            token = request_token(self.session, self.arguments.slot_wait)
+            result["token"] = token
+            result["stage"] = "upload"
+            result["bytes"] = os.path.getsize(copy)
+            result["upload_attempts"] = self.session.upload_file_resumable(
+                token, copy)
+            result["stage"] = "add project"
+            self.session.add_job(token, **settings)
+        except (sheepit.NetworkException, sheepit.UploadException) as e:
+            result["error"] = str(e)
+            self.report(result)
+            return False
+        finally:
+            result["upload_seconds"] = time.monotonic() - start
+        result["ok"] = True
+        result["stage"] = "done"
+        result["frames"] = [settings["anim_start_frame"],
+                            settings["anim_end_frame"]]
+        self.report(result)
+        return True
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    files = expand_files(arguments.files)
+    try:
+        session = login(arguments)
+    except (sheepit.NetworkException, sheepit.LoginException) as e:
+        print(json.dumps({"ok": False, "stage": "login", "error": str(e)}))
+        return 2
+    failed = BatchSubmitter(arguments, session).run(files)
+    # stdout only contains the results of the files
+    print(json.dumps({"retries": session.retry_stats()}), file=sys.stderr)
+    return 1 if failed else 0
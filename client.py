@@ -0,0 +1,111 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import threading
+from . import sheepit, async_sheepit, bandwidth
+
+
+# The one client shared by all operators and their worker threads
+_lock = threading.Lock()
+_client = None
+_async_client = None
+# serialized cookies currently loaded into the shared client
+_cookies = None
+# shared by all uploads, so parallel uploads stay within the limit together
+_bandwidth = bandwidth.BandwidthLimiter()
+
+
+def get_client(cookies=""):
+    """ Returns the shared Sheepit client of this addon
+
+        The client keeps one keep-alive connection pool, so repeated
+        actions skip the DNS lookup and the TCP and TLS handshakes.
+        cookies is the serialized dict stored in the preferences,
+        it is only imported again if it differs from the loaded one """
+    global _client, _cookies
+    with _lock:
+        if _client is None:
+            _client = sheepit.Sheepit()
+            _client.bandwidth = _bandwidth
+        if cookies != _cookies:
+            _client.clear_session()
+            if cookies:
+                _client.import_session(json.loads(cookies))
+            _cookies = cookies
+        return _client
+
+
+def set_timeouts(connect, read, stall):
+    """ Sets the upload timeouts of the shared client in seconds """
+    shared = get_client(_cookies or "")
+    shared.connect_timeout = connect
+    shared.read_timeout = read
+    shared.stall_timeout = stall
+
+
+def set_bandwidth(limit, schedule=None, adaptive=False):
+    """ Sets the upload limit of the shared client in MB/s, 0 for none
+
+        schedule is an optional (start hour, end hour) the limit applies
+        in, adaptive lowers the rate when the round trip time rises """
+    if schedule is not None:
+        schedule = bandwidth.Schedule(*schedule)
+    _bandwidth.configure(limit * bandwidth.MEGABYTE, schedule, adaptive)
+
+
+def get_async_client(cookies=""):
+    """ Returns an AsyncSheepit wrapping the shared client
+
+        Its coroutines are run with async_sheepit.submit() """
+    global _async_client
+    shared = get_client(cookies)
+    with _lock:
+        if _async_client is None or _async_client.client is not shared:
+            _async_client = async_sheepit.AsyncSheepit(shared)
+        return _async_client
+
+
+def unreachable():
+    """ Returns the seconds until the farm is tried again while requests
+        to it fail fast, otherwise 0, without sending a request """
+    with _lock:
+        if _client is None or not _client.circuit_breaker.is_open:
+            return 0
+        return _client.circuit_breaker.retry_in()
+
+
+def export_cookies():
+    """ Returns the cookies of the shared client serialized for the
+        preferences, the client will not reimport them """
+    global _cookies
+    with _lock:
+        if _client is None:
+            return ""
+        _cookies = json.dumps(_client.export_session())
+        return _cookies
+
+
+def close():
+    """ Closes all connections of the shared client """
+    global _client, _async_client, _cookies
+    with _lock:
+        if _async_client is not None:
+            _async_client.close()
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_client = None
+        _cookies = None
+    async_sheepit.stop_loop()
@@ -0,0 +1,136 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Splitting of long animations into several projects
+
+    Every chunk is added as its own project, so more members render it at
+    the same time and the first frames are finished earlier. """
+
+
+from . import sheepit
+
+
+# Chunks smaller than this aren't worth a project slot
+MIN_CHUNK_FRAMES = 25
+
+
+class PartialAddException(Exception):
+    """ Raised when adding a chunk failed after earlier chunks were
+        already added as projects
+
+        added are the settings of the added chunks, failed the ones of
+        the chunk that failed and error its exception """
+
+    def __init__(self, added, failed, error):
+        self.added = added
+        self.failed = failed
+        self.error = error
+        super().__init__(
+            f"frames {describe(failed)} failed ({error}), "
+            f"{len(added)} projects were already added: "
+            f"frames {', '.join(describe(chunk) for chunk in added)}")
+
+
+def describe(chunk):
+    """ Returns the frames of a chunk as text, e.g. 1-50 """
+    text = f"{chunk['anim_start_frame']}-{chunk['anim_end_frame']}"
+    if chunk.get("anim_step_frame", 1) != 1:
+        text += f" step {chunk['anim_step_frame']}"
+    return text
+
+
+def frame_count(start, end, step=1):
+    if end < start:
+        return 0
+    return (end - start) // step + 1
+
+
+def choose_chunks(frames, free_slots, min_frames=MIN_CHUNK_FRAMES):
+    """ Returns the number of chunks for an animation of frames frames
+        using at most free_slots projects """
+    return max(1, min(free_slots, frames // min_frames))
+
+
+def split_range(start, end, step, chunks, interleaved=False):
+    """ Splits the frames start..end into chunks
+
+        Contiguous chunks are consecutive parts of the animation,
+        interleaved chunks take every chunks-th frame, so each of them
+        gives a preview of the whole animation.
+        Returns a list of (start, end, step), empty chunks are left out """
+    count = frame_count(start, end, step)
+    chunks = max(1, min(chunks, count))
+    ranges = []
+    if interleaved:
+        for i in range(chunks):
+            first = start + i * step
+            last = first + (count - 1 - i) // chunks * chunks * step
+            ranges.append((first, last, step * chunks))
+        return ranges
+    offset = 0
+    for i in range(chunks):
+        size = count // chunks + (1 if i < count % chunks else 0)
+        first = start + offset * step
+        ranges.append((first, first + (size - 1) * step, step))
+        offset += size
+    return ranges
+
+
+def chunk_settings(settings, ranges):
+    """ Returns the add_job() settings of every chunk """
+    return [dict(settings, anim_start_frame=first, anim_end_frame=last,
+                 anim_step_frame=step)
+            for first, last, step in ranges]
+
+
+def add_chunks(session, token, path_to_file, chunks, callback=None,
+               cancel=None):
+    """ Adds every chunk of the uploaded file as its own project
+
+        The token of the first upload is reused for the following chunks.
+        If the server doesn't accept it again, the file is uploaded with
+        a new token. Once the maximum number of simultaneous projects is
+        reached the remaining chunks are returned.
+
+        callback is called with the number of added chunks
+        cancel is an optional sheepit.CancelToken
+
+        Raises:
+        NetworkException on a failed connection
+        CancelledException if cancel was cancelled
+        PartialAddException if one of these happened after the first
+            chunk was added """
+    for i, settings in enumerate(chunks):
+        try:
+            if cancel is not None:
+                cancel.check()
+            try:
+                session.add_job(token, **settings)
+            except sheepit.UploadException:
+                # the archive was consumed by the previous chunk
+                try:
+                    token = session.request_upload_token()
+                except sheepit.UploadException:
+                    return chunks[i:]
+                session.upload_file_resumable(token, path_to_file,
+                                              cancel=cancel)
+                session.add_job(token, **settings)
+        except (sheepit.NetworkException, sheepit.UploadException,
+                sheepit.CancelledException) as e:
+            if i == 0:
+                raise
+            raise PartialAddException(chunks[:i], settings, e) from e
+        if callback:
+            callback(i + 1)
+    return []
@@ -0,0 +1,132 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Estimates the peak memory needed to render the open file
+
+    Runs inside Blender after the scene was prepared. The estimate is
+    rough, it adds up the largest consumers of memory while rendering:
+    triangles after subdivision, particles and hair, smoke and volume
+    grids, images and the render buffers. """
+
+
+import bpy
+import os
+
+
+# Blender itself with loaded render kernels
+BASE_BYTES = 512 * 1024 * 1024
+# vertices, normals, uvs and the BVH node of one triangle
+BYTES_PER_TRIANGLE = 200
+BYTES_PER_HAIR_SEGMENT = 64
+BYTES_PER_INSTANCE = 256
+# density, flame, heat and temperature grids of a smoke simulation
+SMOKE_GRIDS = 4
+# combined, depth, normal and denoising passes of a render layer
+RENDER_PASSES = 4
+SAFETY_FACTOR = 1.25
+
+
+def subdivision_levels(obj):
+    levels = 0
+    for modifier in obj.modifiers:
+        if not modifier.show_render:
+            continue
+        if modifier.type in {'SUBSURF', 'MULTIRES'}:
+            levels += modifier.render_levels
+    return levels
+
+
+def mesh_bytes(scene):
+    total = 0
+    counted = set()
+    for obj in scene.objects:
+        if obj.type != 'MESH' or obj.hide_render:
+            continue
+        levels = subdivision_levels(obj)
+        # instances without modifiers share their geometry
+        if not obj.modifiers:
+            if obj.data.name in counted:
+                total += BYTES_PER_INSTANCE
+                continue
+            counted.add(obj.data.name)
+        triangles = len(obj.data.polygons) * 2 * 4 ** levels
+        total += triangles * BYTES_PER_TRIANGLE
+    return total
+
+
+def particle_bytes(scene):
+    total = 0
+    for obj in scene.objects:
+        if obj.hide_render:
+            continue
+        for system in getattr(obj, "particle_systems", ()):
+            settings = system.settings
+            count = settings.count
+            if settings.child_type != 'NONE':
+                count += count * settings.rendered_child_count
+            if settings.type == 'HAIR':
+                total += (count * 2 ** settings.render_step
+                          * BYTES_PER_HAIR_SEGMENT)
+            else:
+                total += count * BYTES_PER_INSTANCE
+    return total
+
+
+def volume_bytes(scene):
+    total = 0
+    for obj in scene.objects:
+        if obj.hide_render:
+            continue
+        for modifier in obj.modifiers:
+            if modifier.type != 'FLUID' or modifier.fluid_type != 'DOMAIN':
+                continue
+            resolution = modifier.domain_settings.resolution_max
+            total += resolution ** 3 * 4 * SMOKE_GRIDS
+    # OpenVDB files are roughly as large in memory as on disk
+    for volume in getattr(bpy.data, "volumes", ()):
+        if volume.users == 0:
+            continue
+        try:
+            total += os.path.getsize(bpy.path.abspath(volume.filepath))
+        except OSError:
+            pass
+    return total
+
+
+def image_bytes():
+    total = 0
+    for image in bpy.data.images:
+        if image.users == 0 or image.type not in {'IMAGE', 'MULTILAYER'}:
+            continue
+        width, height = image.size
+        total += (width * height * image.channels
+                  * (4 if image.is_float else 1))
+    return total
+
+
+def render_bytes(scene):
+    render = scene.render
+    scale = render.resolution_percentage / 100
+    pixels = render.resolution_x * render.resolution_y * scale * scale
+    layers = sum(1 for layer in scene.view_layers if layer.use)
+    return int(pixels * 4 * 4 * RENDER_PASSES * max(1, layers))
+
+
+def estimate(scene=None):
+    """ Returns the estimated peak render memory of scene in bytes """
+    if scene is None:
+        scene = bpy.context.scene
+    total = (BASE_BYTES + mesh_bytes(scene) + particle_bytes(scene)
+             + volume_bytes(scene) + image_bytes() + render_bytes(scene))
+    return int(total * SAFETY_FACTOR)
@@ -13,28 +13,184 @@
 
 
 import bpy
+import hashlib
 import os
-import json
 import threading
-from . import sheepit
-import time
-import subprocess
+from . import sheepit, client, async_sheepit, worker, prepare_cache
+from . import submission_trace, submission_queue, blend_scanner, frame_split
+from . import split_recommender
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 
 
 def register():
     bpy.utils.register_class(SHEEPIT_OT_send_project)
+    bpy.utils.register_class(SHEEPIT_OT_cancel_upload)
     bpy.utils.register_class(SHEEPIT_OT_login)
     bpy.utils.register_class(SHEEPIT_OT_logout)
     bpy.utils.register_class(SHEEPIT_OT_create_accout)
     bpy.utils.register_class(SHEEPIT_OT_refresh_profile)
+    bpy.utils.register_class(SHEEPIT_OT_export_trace)
+    bpy.utils.register_class(SHEEPIT_OT_queue_add_scenes)
+    bpy.utils.register_class(SHEEPIT_OT_queue_add_files)
+    bpy.utils.register_class(SHEEPIT_OT_queue_start)
+    bpy.utils.register_class(SHEEPIT_OT_queue_pause)
+    bpy.utils.register_class(SHEEPIT_OT_queue_clear)
+    bpy.utils.register_class(SHEEPIT_OT_queue_retry)
+    bpy.utils.register_class(SHEEPIT_OT_recommend_split)
+    # continue a queue left running in the last session
+    bpy.app.timers.register(resume_queue, first_interval=1)
 
 
 def unregister():
+    global _queue
+    if _queue is not None:
+        _queue.shutdown()
+        _queue = None
+    client.close()
+    worker.stop_worker()
     bpy.utils.unregister_class(SHEEPIT_OT_send_project)
+    bpy.utils.unregister_class(SHEEPIT_OT_cancel_upload)
     bpy.utils.unregister_class(SHEEPIT_OT_login)
     bpy.utils.unregister_class(SHEEPIT_OT_logout)
     bpy.utils.unregister_class(SHEEPIT_OT_create_accout)
     bpy.utils.unregister_class(SHEEPIT_OT_refresh_profile)
+    bpy.utils.unregister_class(SHEEPIT_OT_export_trace)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_add_scenes)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_add_files)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_start)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_pause)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_clear)
+    bpy.utils.unregister_class(SHEEPIT_OT_queue_retry)
+    bpy.utils.unregister_class(SHEEPIT_OT_recommend_split)
+
+
+def external_files():
+    """ Returns the absolute paths of all external files
+        used by the open blend file """
+    paths = set()
+    for library in bpy.data.libraries:
+        paths.add(library.filepath)
+    for collection in (bpy.data.images, bpy.data.movieclips,
+                       bpy.data.sounds, bpy.data.fonts):
+        for id in collection:
+            if getattr(id, "packed_file", None) is None:
+                paths.add(id.filepath)
+    for cache_file in bpy.data.cache_files:
+        paths.add(cache_file.filepath)
+    if hasattr(bpy.data, "volumes"):
+        for volume in bpy.data.volumes:
+            if volume.packed_file is None:
+                paths.add(volume.filepath)
+    return [bpy.path.abspath(path) for path in paths
+            if path and path != "<builtin>"]
+
+
+_queue = None
+# CancelToken of the running SHEEPIT_OT_send_project
+_submission_cancel = None
+
+
+def get_queue():
+    """ Returns the submission queue, loading it on first use """
+    global _queue
+    if _queue is None:
+        preferences = bpy.context.preferences.addons[__package__].preferences
+        directory = bpy.utils.user_resource('DATAFILES',
+                                            path="sheepit_queue")
+        _queue = submission_queue.SubmissionQueue(
+            directory, bpy.app.binary_path,
+            prepare_jobs=preferences.queue_prepare_jobs)
+    return _queue
+
+
+def set_bandwidth(preferences):
+    schedule = None
+    if preferences.use_limit_schedule:
+        schedule = (preferences.limit_start_hour, preferences.limit_end_hour)
+    client.set_bandwidth(preferences.upload_limit, schedule,
+                         preferences.adaptive_limit)
+
+
+def start_queue(context):
+    preferences = context.preferences.addons[__package__].preferences
+    session = client.get_client(preferences.cookies)
+    client.set_timeouts(preferences.connect_timeout,
+                        preferences.read_timeout, preferences.stall_timeout)
+    set_bandwidth(preferences)
+    get_queue().start(session)
+    if not bpy.app.timers.is_registered(redraw_queue):
+        bpy.app.timers.register(redraw_queue, first_interval=1)
+
+
+def resume_queue():
+    preferences = bpy.context.preferences.addons[__package__].preferences
+    if preferences.logged_in and get_queue().running:
+        start_queue(bpy.context)
+    return None
+
+
+def redraw_queue():
+    """ Redraws the properties editor while the queue is running """
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'PROPERTIES':
+                area.tag_redraw()
+    if _queue is not None and _queue.running:
+        return 1.0
+    return None
+
+
+def job_settings(scene):
+    """ Returns the keyword arguments for Sheepit.add_job()
+        from the SheepIt settings of scene """
+    properties = scene.sheepit_properties
+    animation = properties.type == 'animation'
+    if scene.render.engine == 'CYCLES':
+        cpu = properties.cpu
+        amd = properties.opencl
+        nvidia = properties.cuda
+    else:
+        cpu = False
+        amd = properties.amd
+        nvidia = properties.nvidia
+    split_by_layers = scene.render.engine == 'CYCLES' and scene.use_nodes
+    if animation:
+        split_layers = properties.anim_layer_split
+    else:
+        split_layers = properties.still_layer_split
+    return {
+        "animation": animation,
+        "cpu": cpu,
+        "cuda": nvidia,
+        "opencl": amd,
+        "public": properties.public,
+        "mp4": properties.mp4,
+        "anim_start_frame": scene.frame_start,
+        "anim_end_frame": scene.frame_end,
+        "anim_step_frame": scene.frame_step,
+        "still_frame": scene.frame_current,
+        "max_ram": "",
+        "split_by_layers": split_by_layers,
+        "split_layers": split_layers,
+        "split_tiles": properties.anim_split,
+    }
+
+
+def split_animation(scene, settings, project_slots):
+    """ Returns the add_job() settings of every project the animation
+        of scene is split into, a list with only settings if not split """
+    properties = scene.sheepit_properties
+    if not settings["animation"] or properties.frame_split == 'off':
+        return [settings]
+    chunks = properties.frame_split_chunks
+    if not chunks:
+        frames = frame_split.frame_count(
+            scene.frame_start, scene.frame_end, scene.frame_step)
+        chunks = frame_split.choose_chunks(frames, project_slots)
+    ranges = frame_split.split_range(
+        scene.frame_start, scene.frame_end, scene.frame_step, chunks,
+        interleaved=properties.frame_split == 'interleaved')
+    return frame_split.chunk_settings(settings, ranges)
 
 
 class SHEEPIT_OT_send_project(bpy.types.Operator):
@@ -72,11 +228,22 @@ class SHEEPIT_OT_send_project(bpy.types.Operator):
         if event.type == 'TIMER':
             # do nothing if thread is still runing
             if self.thread.is_alive():
+                if self.cancel_token.cancelled:
+                    self.status = "Cancelling"
+                    if not self.prepared.is_set() and \
+                            not self.abort_prepare.is_set():
+                        self.stop_preparing("cancelled", "Cancelled")
                 bpy.context.window_manager['sheepit']['progress'] = self.progress
                 bpy.context.window_manager['sheepit']['upload_status'] = self.status
                 context.area.tag_redraw()
                 return {'PASS_THROUGH'}
 
+            if self.error_at == "cancelled":
+                self.report({'INFO'}, "Upload cancelled")
+                bpy.context.window_manager['sheepit']['upload_status'] = "Upload cancelled"
+                self.cancel(context)
+                return {'CANCELLED'}
+
             # test if error occurred
             if self.error or self.error_at:
                 # login error:
@@ -90,57 +257,74 @@ class SHEEPIT_OT_send_project(bpy.types.Operator):
                 self.cancel(context)
                 return {'CANCELLED'}
 
-            bpy.context.window_manager['sheepit']['upload_status'] = "Project uploaded!"
+            scene = bpy.data.scenes.get(self.scene_name)
+            if scene is not None and self.max_ram:
+                scene.sheepit_properties.max_ram_estimate = self.max_ram
+            status = "Project uploaded!"
+            if len(self.chunks) > 1:
+                status = f"{len(self.chunks)} projects added!"
+            if self.queued_chunks:
+                # no free project slot left, the queue waits for one. The
+                # prepared file is moved into the queue once and shared by
+                # the chunks, away from the interface as it may be copied
+                chunks = [(settings, f"{self.blend_name} "
+                           f"{settings['anim_start_frame']}-"
+                           f"{settings['anim_end_frame']}")
+                          for settings in self.queued_chunks]
+                self.queue_thread = threading.Thread(
+                    target=queue_prepared,
+                    args=(get_queue(), self.filepath, chunks), daemon=True)
+                self.queue_thread.start()
+                start_queue(context)
+                status = (f"{len(self.chunks) - len(self.queued_chunks)} "
+                          f"projects added, {len(self.queued_chunks)} queued")
+            bpy.context.window_manager['sheepit']['upload_status'] = status
             self.cancel(context)
             return {'FINISHED'}
         return {'PASS_THROUGH'}
 
     def execute(self, context):
-        # prepare cookies
+        # get the shared client
         preferences = context.preferences.addons[__package__].preferences
-        self.cookies = json.loads(preferences.cookies)
+        self.session = client.get_client(preferences.cookies)
+        client.set_timeouts(preferences.connect_timeout,
+                            preferences.read_timeout,
+                            preferences.stall_timeout)
+        set_bandwidth(preferences)
+        self.verify_progress = preferences.verify_progress
+        self.use_worker = preferences.use_worker
+        self.cache = None
+        if preferences.use_cache:
+            cache_directory = bpy.path.abspath(preferences.cache_directory)
+            if not preferences.cache_directory:
+                cache_directory = os.path.join(bpy.app.tempdir,
+                                               "sheepit_cache")
+            self.cache = prepare_cache.PrepareCache(
+                cache_directory, preferences.cache_size * 1024 * 1024)
 
         # prepare variables
-        self.animation = context.scene.sheepit_properties.type == 'animation'
-        self.amd = False
-        self.nvidia = False
-        self.cpu = False
-        if bpy.context.scene.render.engine == 'CYCLES':
-            self.cpu = context.scene.sheepit_properties.cpu
-            self.amd = context.scene.sheepit_properties.opencl
-            self.nvidia = context.scene.sheepit_properties.cuda
-        else:
-            self.amd = context.scene.sheepit_properties.amd
-            self.nvidia = context.scene.sheepit_properties.nvidia
-        self.public = context.scene.sheepit_properties.public
-        self.mp4 = context.scene.sheepit_properties.mp4
-        self.frame_start = context.scene.frame_start
-        self.frame_end = context.scene.frame_end
-        self.frame_step = context.scene.frame_step
-        self.frame_current = context.scene.frame_current
-
-        self.split_by_layers = False
-        if bpy.context.scene.render.engine == 'CYCLES' \
-                and bpy.context.scene.use_nodes:
-            self.split_by_layers = True
-        self.split_tiles = context.scene.sheepit_properties.anim_split
-        if self.animation:
-            self.split_layers = context.scene.sheepit_properties.anim_layer_split
-        else:
-            self.split_layers = context.scene.sheepit_properties.still_layer_split
+        self.settings = job_settings(context.scene)
+        self.chunks = split_animation(context.scene, self.settings,
+                                      preferences.project_slots)
+        self.queued_chunks = []
+        self.queue_thread = None
+        self.scene_name = context.scene.name
+        self.use_max_ram = context.scene.sheepit_properties.use_max_ram
+        self.max_ram = ""
 
         # Save file
         blend_name = os.path.split(bpy.data.filepath)[1]
         if not blend_name:
             blend_name = "untitled.blend"
         self.filepath = os.path.join(bpy.app.tempdir, blend_name)
-        bpy.ops.wm.save_as_mainfile(filepath=self.filepath, copy=True)
+        self.blend_name = blend_name
+        self.trace = submission_trace.Trace(f"SheepIt: {blend_name}")
+        with self.trace.stage("save copy", "disk") as stage:
+            bpy.ops.wm.save_as_mainfile(filepath=self.filepath, copy=True)
+            stage.bytes = os.path.getsize(self.filepath)
+        self.dependencies = external_files()
 
-        # Prepare script variables
         self.blender_exe = bpy.app.binary_path
-        self.prepare_script = os.path.join(os.path.dirname(__file__),
-                                           "prepare_scene.py"
-                                           )
 
         if 'sheepit' not in bpy.context.window_manager:
             bpy.context.window_manager['sheepit'] = dict()
@@ -150,6 +334,12 @@ class SHEEPIT_OT_send_project(bpy.types.Operator):
         bpy.context.window_manager['sheepit']['progress'] = 0
         self.progress = 0
 
+        global _submission_cancel
+        self.cancel_token = sheepit.CancelToken()
+        _submission_cancel = self.cancel_token
+        self.prepared = threading.Event()
+        self.abort_prepare = threading.Event()
+
         self.thread = threading.Thread(target=self.send_project)
         self.thread.start()
 
@@ -167,125 +357,193 @@ class SHEEPIT_OT_send_project(bpy.types.Operator):
         self.error = ""
         self.error_at = ""
 
-        session = sheepit.Sheepit()
-
-        # import cookies
-        session.import_session(self.cookies)
-
-        self.status = "Testing connection"
-
-        # test if logged in
-        try:
-            if not session.is_logged_in():
-                self.error = "Please Log in"
-                self.error_at = "login"
-                return
-        except sheepit.NetworkException as e:
-            self.error = str(e)
-            self.error_at = "login"
-            return
-        
-        self.progress = 5
+        session = self.session
+        trace = self.trace
 
         self.status = "Preparing Scene"
 
-        # Prepare scene
-        r = subprocess.run(
-            [
-                self.blender_exe,
-                self.filepath,
-                "--background",
-                "--factory-startup",
-                "--python",
-                self.prepare_script
-            ], shell=True
-        )
-        try:
-            with open(f"{self.filepath}.log", "r") as f:
-                output = f.read().split("<->")
-
-                if len(output) == 0 or output[0] != "OK":
-                    if len(output) > 1:
-                        self.error = output[1]
-                    else:
-                        self.error = "unknown error"
-                    self.error_at = "prepare scene"
-                    return
-        except OSError:
-            self.error = "Error opening log"
-            self.error_at = "prepare scene"
-            return
+        # Prepare scene, the connection is tested, a token is requested
+        # and the upload connection kept warm at the same time
+        self.connection_error = None
+        connection_thread = threading.Thread(
+            target=self.prepare_connection, args=(session,))
+        connection_thread.start()
 
-        self.progress = 10
+        result = self.prepare_scene()
+        self.prepared.set()
+        connection_thread.join()
 
-        self.status = "Getting Token"
-
-        # request a upload token from the SheepIt server
-        token = ""
-        try:
-            token = session.request_upload_token()
-        except sheepit.NetworkException as e:
-            self.error = str(e)
-            self.error_at = "token"
+        if self.connection_error:
+            self.error_at, self.error = self.connection_error
             return
-        except sheepit.UploadException as e:
-            self.error = str(e)
-            self.error_at = "token"
+        if not result["ok"]:
+            self.error = result["error"]
+            self.error_at = "prepare scene"
             return
+        if result.get("max_ram"):
+            self.max_ram = worker.max_ram_setting(result)
+        if self.use_max_ram and self.max_ram:
+            for settings in [self.settings] + self.chunks:
+                settings["max_ram"] = self.max_ram
+
         self.progress = 15
+        token = self.token
 
         self.status = "Uploading File"
 
-        self.token = token
-        self.upload_thread.start()
+        self.server_progress = None
+        if self.verify_progress:
+            self.upload_thread.start()
 
         # upload the file
         try:
-            session.upload_file(token, self.filepath)
+            with trace.stage("upload", "network") as stage:
+                stage.bytes = os.path.getsize(self.filepath)
+                attempts = session.upload_file_resumable(
+                    token, self.filepath, callback=self.on_upload_progress,
+                    cancel=self.cancel_token)
+                stage.retries = attempts - 1
+        except sheepit.CancelledException:
+            self.error_at = "cancelled"
+            return
         except sheepit.NetworkException as e:
             self.error = str(e)
             self.error_at = "upload"
-            self.uploading = False
             return
-        self.uploading = False
-        if self.upload_thread.isAlive():
-            self.upload_thread.join()
+        finally:
+            self.uploading = False
         self.progress = 95
 
         self.status = "Adding Project"
         try:
-            session.add_job(token,
-                            animation=self.animation,
-                            cpu=self.cpu,
-                            cuda=self.nvidia,
-                            opencl=self.amd,
-                            public=self.public,
-                            mp4=self.mp4,
-                            anim_start_frame=self.frame_start,
-                            anim_end_frame=self.frame_end,
-                            anim_step_frame=self.frame_step,
-                            still_frame=self.frame_current,
-                            max_ram="",
-                            split_by_layers=self.split_by_layers,
-                            split_layers=self.split_layers,
-                            split_tiles=self.split_tiles)
-        except sheepit.NetworkException as e:
+            with trace.stage("add project", "network") as stage:
+                self.add_job(session, token)
+                stage.args["projects"] = len(self.chunks)
+        except frame_split.PartialAddException as e:
+            # some chunks are projects already, even if cancelled
+            self.error = str(e)
+            self.error_at = "add project"
+        except sheepit.CancelledException:
+            self.error_at = "cancelled"
+        except (sheepit.NetworkException, sheepit.UploadException) as e:
             self.error = str(e)
             self.error_at = "add project"
         self.progress = 100
         return
 
-    def update_progress(self):
-        session = sheepit.Sheepit()
+    def add_job(self, session, token):
+        self.cancel_token.check()
+        if len(self.chunks) == 1:
+            session.add_job(token, **self.settings)
+            return
+
+        def on_added(added):
+            self.status = f"Added Project {added} of {len(self.chunks)}"
+        self.queued_chunks = frame_split.add_chunks(
+            session, token, self.filepath, self.chunks, callback=on_added,
+            cancel=self.cancel_token)
+
+    def prepare_scene(self):
+        """ Prepares the saved copy, a cached result is reused if neither
+            the scene nor its external files changed """
+        trace = self.trace
+        key = None
+        if self.cache:
+            self.status = "Checking Cache"
+            with trace.stage("cache lookup", "disk") as stage:
+                key = self.cache.key(self.filepath, self.dependencies)
+                hit = self.cache.get(key, self.filepath)
+                stage.args["hit"] = hit
+            if hit:
+                # the estimate of preparing the cached file
+                return {"ok": True, "error": "", "cached": True,
+                        "max_ram": self.cache.metadata(key).get("max_ram")}
+            self.status = "Preparing Scene"
+        with trace.stage("prepare scene", "blender") as stage:
+            result = self.run_prepare()
+        # the steps measured inside Blender
+        start = stage.start
+        for name, seconds in result.get("timings", {}).items():
+            trace.add(f"prepare: {name}", "blender", start, seconds,
+                      nested=True)
+            start += seconds
+        if result["ok"] and key:
+            with trace.stage("cache store", "disk"):
+                try:
+                    self.cache.put(key, self.filepath,
+                                   {"max_ram": result.get("max_ram")})
+                except OSError as e:
+                    print(f"SheepIt: could not cache prepared file: {e}")
+        return result
+
+    def run_prepare(self):
+        """ Prepares the saved copy in the background Blender worker,
+            or in a new Blender process if the worker is disabled """
+        if self.use_worker:
+            prepare_worker = worker.get_worker(self.blender_exe)
+            try:
+                return prepare_worker.prepare(self.filepath,
+                                              abort=self.abort_prepare)
+            except worker.WorkerException as e:
+                if self.abort_prepare.is_set():
+                    return {"ok": False, "error": "aborted"}
+                # fall back to a new process
+                print(f"SheepIt: {e}")
+        return worker.prepare_in_subprocess(self.blender_exe, self.filepath,
+                                            self.abort_prepare)
+
+    def prepare_connection(self, session):
+        """ Runs while the scene is prepared
+            Tests the login, requests a upload token and keeps
+            the connection alive until the prepared file is ready """
+        # test if logged in
+        try:
+            with self.trace.stage("login check", "network"):
+                logged_in = session.is_logged_in()
+            if not logged_in:
+                self.stop_preparing("login", "Please Log in")
+                return
+        except sheepit.NetworkException as e:
+            self.stop_preparing("login", str(e))
+            return
+        self.progress = 5
 
-        # import cookies
-        session.import_session(self.cookies)
+        # request a upload token from the SheepIt server
+        try:
+            with self.trace.stage("token", "network"):
+                self.token = session.request_upload_token()
+        except (sheepit.NetworkException, sheepit.UploadException) as e:
+            self.stop_preparing("token", str(e))
+            return
+        self.progress = 10
+
+        # keep the pooled connection open for the upload
+        while not self.prepared.wait(10):
+            session.warm_up()
+
+    def stop_preparing(self, error_at, error):
+        """ There is no need to finish preparing a scene we can't upload """
+        self.connection_error = (error_at, error)
+        # the shared worker ignores the reply of our job
+        self.abort_prepare.set()
+
+    def on_upload_progress(self, progress):
+        self.progress = int(15+(progress.fraction*80))
+        status = f"Uploading File ({progress}"
+        # optional cross-check with the progress reported by the server
+        if self.server_progress is not None:
+            status += f", server {self.server_progress*100:.0f}%"
+        self.status = status + ")"
+
+    def update_progress(self):
+        session = self.session
         while self.uploading:
-            time.sleep(1)
+            if self.cancel_token.wait(1):
+                return
             try:
                 p = session.get_upload_progress(self.token)
                 if p:
-                    self.progress = int(15+(p*80))
+                    self.server_progress = p
             except Exception:
                 pass
 
@@ -294,18 +552,208 @@ class SHEEPIT_OT_send_project(bpy.types.Operator):
         wm.event_timer_remove(self._timer)
         bpy.context.window_manager['sheepit']['upload_active'] = False
         del bpy.context.window_manager['sheepit']['progress']
+        global _submission_cancel
+        _submission_cancel = None
         self.uploading = False
-        if self.upload_thread.isAlive():
-            self.upload_thread.join()
-        if self.thread.isAlive():
-            self.thread.join()
+        if self.thread.is_alive():
+            # cancelled by Blender, e.g. when loading another file
+            self.cancel_token.cancel()
+            if not self.prepared.is_set():
+                self.stop_preparing("cancelled", "Cancelled")
+        # keep the timings of this submission
+        submission_trace.last_trace = self.trace
+        bpy.context.window_manager['sheepit']['trace_summary'] = \
+            "\n".join(self.trace.summary())
+        # the threads may still be stopping, don't block the interface
+        threading.Thread(
+            target=remove_when_finished,
+            args=(self.filepath, [self.thread, self.upload_thread,
+                                  self.queue_thread]),
+            daemon=True).start()
+        context.area.tag_redraw()
+
+
+def queue_prepared(queue, filepath, chunks):
+    try:
+        queue.add_prepared(filepath, chunks)
+    except OSError as e:
+        print(f"SheepIt: could not queue {len(chunks)} projects: {e}")
+
+
+def remove_when_finished(filepath, threads):
+    """ Waits for the threads of a submission, then removes its files """
+    for thread in threads:
+        if thread is not None and thread.is_alive():
+            thread.join()
+    worker.remove_files(filepath)
+
+
+class SHEEPIT_OT_cancel_upload(bpy.types.Operator):
+    """ Cancel the running upload """
+    bl_idname = "sheepit.cancel_upload"
+    bl_label = "Cancel"
+
+    @classmethod
+    def poll(cls, context):
+        return _submission_cancel is not None and \
+            not _submission_cancel.cancelled
+
+    def execute(self, context):
+        _submission_cancel.cancel()
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_export_trace(bpy.types.Operator, ExportHelper):
+    """ Export the timings of the last submission as a
+        Chrome trace (chrome://tracing or ui.perfetto.dev) """
+    bl_idname = "sheepit.export_trace"
+    bl_label = "Export Timings"
+
+    filename_ext = ".json"
+    filter_glob: bpy.props.StringProperty(default="*.json",
+                                          options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, context):
+        return submission_trace.last_trace is not None
+
+    def execute(self, context):
         try:
-            os.remove(self.filepath)
-            os.remove(f"{self.filepath}.log")
-            os.remove(f"{self.filepath}1")
-        except FileNotFoundError as e:
-            pass
+            submission_trace.last_trace.save(self.filepath)
+        except OSError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_add_scenes(bpy.types.Operator):
+    """ Add the current scene to the submission queue """
+    bl_idname = "sheepit.queue_add_scenes"
+    bl_label = "Queue Scene"
+
+    all_scenes: bpy.props.BoolProperty(
+        name="All Scenes", default=False,
+        description="Queue every scene of this file as its own project")
+
+    @classmethod
+    def poll(cls, context):
+        preferences = context.preferences.addons[__package__].preferences
+        return preferences.logged_in
+
+    def execute(self, context):
+        queue = get_queue()
+        blend_name = os.path.split(bpy.data.filepath)[1] or "untitled.blend"
+        window = context.window
+        active_scene = window.scene
+        scenes = bpy.data.scenes if self.all_scenes else [context.scene]
+        try:
+            for scene in scenes:
+                # the saved file opens with this scene
+                window.scene = scene
+                filepath = os.path.join(
+                    bpy.app.tempdir,
+                    f"{os.path.splitext(blend_name)[0]}_{scene.name}.blend")
+                bpy.ops.wm.save_as_mainfile(filepath=filepath, copy=True)
+                queue.add(filepath, job_settings(scene),
+                          name=f"{blend_name} / {scene.name}", copy=False,
+                          use_max_ram=scene.sheepit_properties.use_max_ram)
+        finally:
+            window.scene = active_scene
         context.area.tag_redraw()
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_add_files(bpy.types.Operator, ImportHelper):
+    """ Add .blend files to the submission queue,
+        they use the SheepIt settings of the current scene
+        and the frame range of their own active scene """
+    bl_idname = "sheepit.queue_add_files"
+    bl_label = "Queue Files"
+
+    filename_ext = ".blend"
+    filter_glob: bpy.props.StringProperty(default="*.blend",
+                                          options={'HIDDEN'})
+    files: bpy.props.CollectionProperty(
+        type=bpy.types.OperatorFileListElement)
+    directory: bpy.props.StringProperty(subtype='DIR_PATH')
+
+    @classmethod
+    def poll(cls, context):
+        preferences = context.preferences.addons[__package__].preferences
+        return preferences.logged_in
+
+    def execute(self, context):
+        queue = get_queue()
+        for file in self.files:
+            filepath = os.path.join(self.directory, file.name)
+            settings = job_settings(context.scene)
+            try:
+                summary = blend_scanner.scan(filepath)
+            except (OSError, blend_scanner.ScanException) as e:
+                self.report({'WARNING'}, f"{file.name}: {e}")
+                continue
+            for scene in summary["scenes"]:
+                if scene["name"] == summary["active_scene"]:
+                    settings["anim_start_frame"] = scene["frame_start"]
+                    settings["anim_end_frame"] = scene["frame_end"]
+                    settings["anim_step_frame"] = scene["frame_step"]
+                    settings["still_frame"] = scene["frame_current"]
+            queue.add(filepath, settings, use_max_ram=(
+                context.scene.sheepit_properties.use_max_ram))
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_start(bpy.types.Operator):
+    """ Start preparing and uploading the queued projects """
+    bl_idname = "sheepit.queue_start"
+    bl_label = "Start Queue"
+
+    @classmethod
+    def poll(cls, context):
+        preferences = context.preferences.addons[__package__].preferences
+        return preferences.logged_in and not get_queue().running
+
+    def execute(self, context):
+        start_queue(context)
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_pause(bpy.types.Operator):
+    """ Pause the queue after the current upload """
+    bl_idname = "sheepit.queue_pause"
+    bl_label = "Pause Queue"
+
+    @classmethod
+    def poll(cls, context):
+        return get_queue().running
+
+    def execute(self, context):
+        get_queue().pause()
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_clear(bpy.types.Operator):
+    """ Remove finished and failed projects from the queue """
+    bl_idname = "sheepit.queue_clear"
+    bl_label = "Clear Finished"
+
+    def execute(self, context):
+        get_queue().remove_finished()
+        context.area.tag_redraw()
+        return {'FINISHED'}
+
+
+class SHEEPIT_OT_queue_retry(bpy.types.Operator):
+    """ Queue failed projects again """
+    bl_idname = "sheepit.queue_retry"
+    bl_label = "Retry Failed"
+
+    def execute(self, context):
+        get_queue().retry_failed()
+        context.area.tag_redraw()
+        return {'FINISHED'}
 
 
 class SHEEPIT_OT_logout(bpy.types.Operator):
@@ -320,10 +768,7 @@ class SHEEPIT_OT_logout(bpy.types.Operator):
 
     def execute(self, context):
         preferences = context.preferences.addons[__package__].preferences
-        session = sheepit.Sheepit()
-
-        # import cookies
-        session.import_session(json.loads(preferences.cookies))
+        session = client.get_client(preferences.cookies)
         try:
             session.logout()
         except sheepit.NetworkException as e:
@@ -356,19 +801,23 @@ class SHEEPIT_OT_refresh_profile(bpy.types.Operator):
 
     def modal(self, context, event):
         if event.type == 'TIMER':
-            # do nothing if thread is still runing
-            if self.thread.is_alive():
+            # do nothing if the request is still runing
+            if not self.future.done():
                 return {'PASS_THROUGH'}
 
             # test if error occurred
-            if type(self.profile) is sheepit.NetworkException:
-                self.report({'ERROR'}, str(self.profile))
+            try:
+                self.profile = self.future.result()
+            except Exception as e:
+                # any failure must end the refresh, or it stays active
+                self.report({'ERROR'}, str(e) or type(e).__name__)
                 self.cancel(context)
                 return {'CANCELLED'}
 
             # test if logged in
             if not self.profile['Points']:
                 self.report({'ERROR'}, "Please Log in")
+                preferences = context.preferences.addons[__package__].preferences
                 preferences.logged_in = False
                 preferences.cookies = ""
                 preferences.username = ""
@@ -383,10 +832,10 @@ class SHEEPIT_OT_refresh_profile(bpy.types.Operator):
 
     def execute(self, context):
         preferences = context.preferences.addons[__package__].preferences
-        self.cookies = json.loads(preferences.cookies)
+        session = client.get_async_client(preferences.cookies)
 
-        self.thread = threading.Thread(target=self.request_profile)
-        self.thread.start()
+        self.future = async_sheepit.submit(
+            session.get_profile_information())
 
         if 'sheepit' not in bpy.context.window_manager:
             bpy.context.window_manager['sheepit'] = dict()
@@ -406,16 +855,131 @@ class SHEEPIT_OT_refresh_profile(bpy.types.Operator):
         bpy.context.window_manager['sheepit']['refresh_active'] = False
         context.area.tag_redraw()
 
-    def request_profile(self):
-        session = sheepit.Sheepit()
 
-        # import cookies
-        session.import_session(self.cookies)
+def probe_key(scene):
+    """ Returns a key of the settings a probe render of scene depends on """
+    render = scene.render
+    if render.engine == 'CYCLES':
+        samples = scene.cycles.samples
+    else:
+        samples = scene.eevee.taa_render_samples
+    polygons = sum(len(mesh.polygons) for mesh in bpy.data.meshes)
+    key = (render.engine, render.resolution_x, render.resolution_y,
+           render.resolution_percentage, samples, scene.frame_start,
+           scene.frame_end, scene.frame_current, scene.use_nodes,
+           len(scene.objects), polygons)
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class SHEEPIT_OT_recommend_split(bpy.types.Operator):
+    """ Render small probe frames on this computer and choose how
+    frames are split from the estimated render time """
+    bl_idname = "sheepit.recommend_split"
+    bl_label = "Recommend Split"
+
+    force: bpy.props.BoolProperty(
+        name="Probe Again",
+        description="Render the probe frames even if the scene "
+        "didn't change since the last probe",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        if context.scene.render.engine not in {'CYCLES', 'BLENDER_EEVEE'}:
+            return False
+        # test if allready probing
+        if 'sheepit' in bpy.context.window_manager:
+            return not bpy.context.window_manager['sheepit'].get(
+                'probe_active', False)
+        return True
+
+    def modal(self, context, event):
+        if event.type == 'TIMER':
+            # do nothing if the probe is still rendering
+            if self.thread.is_alive():
+                return {'PASS_THROUGH'}
 
+            if self.result is None or "error" in self.result:
+                error = (self.result or {}).get("error", "no result")
+                self.report({'ERROR'}, f"probe render: {error}")
+                self.cancel(context)
+                return {'CANCELLED'}
+
+            scene = bpy.data.scenes[self.scene_name]
+            properties = scene.sheepit_properties
+            properties.probe_key = self.key
+            properties.probe_seconds = split_recommender.estimate(self.result)
+            self.apply(scene)
+            self.cancel(context)
+            return {'FINISHED'}
+        return {'PASS_THROUGH'}
+
+    def execute(self, context):
+        scene = context.scene
+        self.scene_name = scene.name
+        self.key = probe_key(scene)
+        if scene.sheepit_properties.probe_key == self.key and not self.force:
+            # the cached estimate is still valid
+            self.apply(scene)
+            return {'FINISHED'}
+
+        # Save file
+        blend_name = os.path.split(bpy.data.filepath)[1]
+        if not blend_name:
+            blend_name = "untitled.blend"
+        self.filepath = os.path.join(bpy.app.tempdir, f"probe_{blend_name}")
+        bpy.ops.wm.save_as_mainfile(filepath=self.filepath, copy=True)
+
+        if scene.sheepit_properties.type == 'animation':
+            frames = split_recommender.probe_frames(scene.frame_start,
+                                                    scene.frame_end)
+        else:
+            frames = [scene.frame_current]
+        self.result = None
+        self.abort = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run_probe, args=(bpy.app.binary_path, frames))
+        self.thread.start()
+
+        if 'sheepit' not in bpy.context.window_manager:
+            bpy.context.window_manager['sheepit'] = dict()
+        bpy.context.window_manager['sheepit']['probe_active'] = True
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        wm.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def run_probe(self, blender_exe, frames):
         try:
-            self.profile = session.get_profile_information()
-        except sheepit.NetworkException as e:
-            self.profile = e
+            self.result = split_recommender.probe(
+                blender_exe, self.filepath, frames, abort=self.abort)
+        except Exception as e:
+            self.result = {"error": str(e) or type(e).__name__}
+
+    def apply(self, scene):
+        """ Sets the split properties of scene from its estimate """
+        properties = scene.sheepit_properties
+        split_layers = scene.render.engine == 'CYCLES' and scene.use_nodes
+        recommended = split_recommender.recommend(
+            properties.probe_seconds, split_layers,
+            properties.type == 'animation')
+        for name, value in recommended.items():
+            setattr(properties, name, value)
+        minutes = properties.probe_seconds / 60
+        self.report({'INFO'}, f"About {minutes:.1f} min per frame")
+
+    def cancel(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        bpy.context.window_manager['sheepit']['probe_active'] = False
+        # kills the probe render, its files are removed once it stopped
+        self.abort.set()
+        threading.Thread(target=remove_when_finished,
+                         args=(self.filepath, [self.thread]),
+                         daemon=True).start()
+        context.area.tag_redraw()
 
 
 class SHEEPIT_OT_login(bpy.types.Operator):
@@ -438,7 +1002,7 @@ class SHEEPIT_OT_login(bpy.types.Operator):
 
     def execute(self, context):
         # Login with the provided Username and Password
-        session = sheepit.Sheepit()
+        session = client.get_client()
         error = False
         try:
             session.login(username=self.username, password=self.password)
@@ -454,7 +1018,7 @@ class SHEEPIT_OT_login(bpy.types.Operator):
             return {'CANCELLED'}
 
         # Generate preferences
-        cookies = json.dumps(session.export_session())
+        cookies = client.export_cookies()
 
         # Save
         preferences = context.preferences.addons[__package__].preferences
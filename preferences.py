@@ -25,10 +25,135 @@ def unregister():
 
 class SheepItPreferences(bpy.types.AddonPreferences):
     """ Persistant properties for this Addon
-        Currently only login information is stored here. """
+        Login information and upload settings are stored here. """
     bl_idname = __package__
 
     # cookies are stored as a serialized dict
     cookies: bpy.props.StringProperty(default="")
     username: bpy.props.StringProperty(default="")
     logged_in: bpy.props.BoolProperty(default=False)
+
+    verify_progress: bpy.props.BoolProperty(
+        name="Cross-check upload progress with the server",
+        default=False,
+        description="The upload progress is counted locally. "
+        "If enabled, the progress reported by the server is additionally "
+        "requested every second and shown next to it.")
+
+    use_worker: bpy.props.BoolProperty(
+        name="Keep a Blender process for preparing scenes",
+        default=True,
+        description="Prepare scenes in a background Blender process that "
+        "is started once and kept running, instead of starting a new "
+        "Blender for every upload.")
+
+    use_cache: bpy.props.BoolProperty(
+        name="Cache prepared files",
+        default=True,
+        description="Reuse the prepared file if the scene and its "
+        "external files did not change since the last upload.")
+    cache_directory: bpy.props.StringProperty(
+        name="Cache Directory",
+        subtype='DIR_PATH',
+        default="",
+        description="Where prepared files are cached, "
+        "leave empty to use Blender's temporary directory")
+    cache_size: bpy.props.IntProperty(
+        name="Cache Size (MB)",
+        default=4096,
+        min=100,
+        description="The least recently used files are removed "
+        "once the cache grows above this size")
+
+    queue_prepare_jobs: bpy.props.IntProperty(
+        name="Parallel Prepares",
+        default=2,
+        min=1,
+        max=64,
+        description="How many Blender processes the submission queue "
+        "may run at the same time to prepare projects")
+
+    project_slots: bpy.props.IntProperty(
+        name="Simultaneous Projects",
+        default=2,
+        min=1,
+        max=64,
+        description="Maximum number of simultaneous projects of your "
+        "account, used when splitting animations")
+
+    connect_timeout: bpy.props.IntProperty(
+        name="Connect Timeout",
+        default=10,
+        min=1,
+        max=600,
+        description="Seconds to wait for a connection to the farm "
+        "when uploading or adding a project")
+    read_timeout: bpy.props.IntProperty(
+        name="Response Timeout",
+        default=120,
+        min=1,
+        max=3600,
+        description="Seconds to wait for the farm to respond "
+        "after the project was sent")
+    stall_timeout: bpy.props.IntProperty(
+        name="Stall Timeout",
+        default=60,
+        min=5,
+        max=3600,
+        description="An upload that sent no data for this many seconds "
+        "is aborted and started again")
+
+    upload_limit: bpy.props.FloatProperty(
+        name="Upload Limit (MB/s)",
+        default=0.0,
+        min=0.0,
+        precision=1,
+        description="Maximum upload speed, 0 for no limit. "
+        "Keeps the network usable for others while a project is sent")
+    use_limit_schedule: bpy.props.BoolProperty(
+        name="Limit only during these hours",
+        default=False,
+        description="Apply the upload limit only between the start and "
+        "end hour, uploads are unlimited the rest of the day")
+    limit_start_hour: bpy.props.IntProperty(
+        name="From",
+        default=9,
+        min=0,
+        max=23,
+        description="Hour the upload limit starts to apply")
+    limit_end_hour: bpy.props.IntProperty(
+        name="To",
+        default=18,
+        min=0,
+        max=24,
+        description="Hour the upload limit stops to apply")
+    adaptive_limit: bpy.props.BoolProperty(
+        name="Slow down uploads on a busy network",
+        default=False,
+        description="Measure the round trip time to the farm while "
+        "uploading and lower the upload speed when it rises")
+
+    def draw(self, context):
+        self.layout.prop(self, "verify_progress")
+        self.layout.prop(self, "use_worker")
+        self.layout.prop(self, "use_cache")
+        cache = self.layout.column()
+        cache.active = self.use_cache
+        cache.prop(self, "cache_directory")
+        cache.prop(self, "cache_size")
+        self.layout.prop(self, "queue_prepare_jobs")
+        self.layout.prop(self, "project_slots")
+        timeouts = self.layout.column(align=True)
+        timeouts.prop(self, "connect_timeout")
+        timeouts.prop(self, "read_timeout")
+        timeouts.prop(self, "stall_timeout")
+        bandwidth = self.layout.column()
+        bandwidth.prop(self, "upload_limit")
+        schedule = bandwidth.row(align=True)
+        schedule.active = self.upload_limit > 0
+        schedule.prop(self, "use_limit_schedule")
+        hours = schedule.row(align=True)
+        hours.active = self.use_limit_schedule
+        hours.prop(self, "limit_start_hour")
+        hours.prop(self, "limit_end_hour")
+        bandwidth.prop(self, "adaptive_limit")
@@ -0,0 +1,141 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+
+class PrepareCache():
+    """ Cache of prepared .blend files
+
+        Entries are keyed on the content of the saved source file and the
+        modification time and size of every external file it references,
+        so an unchanged scene doesn't need to be prepared again.
+        The least recently used entries are removed once the cache grows
+        above max_size bytes. """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def key(self, source_file, dependencies=()):
+        """ Returns the cache key of source_file
+
+            dependencies are the absolute paths of all external files
+            (images, libraries, caches...) used by source_file """
+        h = hashlib.sha256()
+        with open(source_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        for path in sorted(set(dependencies)):
+            try:
+                stat = os.stat(path)
+                h.update(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0"
+                         .encode("utf-8", "surrogateescape"))
+            except OSError:
+                h.update(f"{path}\0missing\0".encode(
+                    "utf-8", "surrogateescape"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.blend")
+
+    def _metadata_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, destination):
+        """ Places the cached file of key at destination
+
+            Returns False if key is not cached """
+        path = self._path(key)
+        with self._lock:
+            if not os.path.isfile(path):
+                return False
+            # mark as recently used
+            os.utime(path)
+            _link_or_copy(path, destination)
+        return True
+
+    def metadata(self, key):
+        """ Returns the metadata stored with key, an empty dict if there
+            is none """
+        try:
+            with open(self._metadata_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def put(self, key, prepared_file, metadata=None):
+        """ Adds prepared_file to the cache under key
+
+            metadata is an optional dict saved as JSON with the file,
+            e.g. the results of preparing it """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        with self._lock:
+            if metadata is not None:
+                temp_path = f"{self._metadata_path(key)}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump(metadata, f)
+                os.replace(temp_path, self._metadata_path(key))
+            temp_path = f"{path}.tmp"
+            _link_or_copy(prepared_file, temp_path)
+            os.replace(temp_path, path)
+            os.utime(path)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".blend") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        # oldest first
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            try:
+                os.remove(f"{os.path.splitext(path)[0]}.json")
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """ Removes all cached files """
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith((".blend", ".json")):
+                    os.remove(entry.path)
+
+
+def _link_or_copy(source, destination):
+    try:
+        os.remove(destination)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
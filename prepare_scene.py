@@ -13,37 +13,154 @@
 
 
 import bpy
+import os
+import sys
+import time
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import memory_estimate  # noqa: E402
+
+
+# Datablock types that are never purged, even without users
+KEEP_TYPES = {"scenes", "screens", "window_managers", "workspaces",
+              "libraries", "texts"}
+
+
+# Most purge passes, each one removes a further level of dependencies
+MAX_PURGE_PASSES = 100
+
+
+def make_paths_absolute(directory):
+    """ Makes the paths relative to the .blend file absolute, resolving
+        them from directory, where the file was saved before it was
+        copied. Libraries are reloaded from their absolute path. """
+    libraries = []
+    for name in dir(bpy.data):
+        collection = getattr(bpy.data, name)
+        if not isinstance(collection, bpy.types.bpy_prop_collection):
+            continue
+        for id in collection:
+            # the paths of linked datablocks are relative to their library
+            if not isinstance(id, bpy.types.ID) or id.library is not None:
+                continue
+            path = getattr(id, "filepath", None)
+            if isinstance(path, str) and path.startswith("//"):
+                id.filepath = bpy.path.abspath(path, start=directory)
+                if isinstance(id, bpy.types.Library):
+                    libraries.append(id)
+    for library in libraries:
+        library.reload()
+
+
+def purge_orphans():
+    """ Removes all datablocks without users, repeated until none are
+        left, because removing one can orphan the datablocks it used
+
+        Datablocks that are still there after being removed, e.g. linked
+        ones, are not tried again, so the passes end once no new orphans
+        are found or after MAX_PURGE_PASSES
+        Returns the number of removed datablocks """
+    removed = 0
+    tried = set()
+    for _ in range(MAX_PURGE_PASSES):
+        orphans = []
+        for name in dir(bpy.data):
+            if name in KEEP_TYPES:
+                continue
+            collection = getattr(bpy.data, name)
+            if not isinstance(collection, bpy.types.bpy_prop_collection):
+                continue
+            orphans.extend(
+                id for id in collection
+                if isinstance(id, bpy.types.ID)
+                and id.users == 0 and not id.use_fake_user
+                and id.as_pointer() not in tried)
+        if not orphans:
+            break
+        tried.update(id.as_pointer() for id in orphans)
+        bpy.data.batch_remove(ids=orphans)
+        removed += len(orphans)
+    return removed
+
+
+def prepare(timings=None, directory=None):
+    """ Prepares the opened file for the Renderfarm and saves it
+
+        If given, timings is filled with the seconds spent per step
+        directory is where the file was saved before it was copied,
+        relative paths are resolved from there
+        Returns the error text or an empty string on success """
+    if timings is None:
+        timings = dict()
+    step_start = time.perf_counter()
+
+    def step(name):
+        nonlocal step_start
+        now = time.perf_counter()
+        timings[name] = now - step_start
+        step_start = now
 
-def main():
-    had_error = False
-    error_text = ""
     try:
+        if directory:
+            make_paths_absolute(directory)
+            step("absolute paths")
         # Go to object mode
         bpy.ops.object.mode_set(mode='OBJECT')
         # Select all
         bpy.ops.object.select_all(action="SELECT")
         # Make all linked models local
         bpy.ops.object.make_local(type='ALL')
-        # Purge all (reload file because orphans_purge is not working)
-        bpy.ops.wm.save_as_mainfile(compress=False)
-        for i in range(3):
-            bpy.ops.wm.revert_mainfile()
+        step("make local")
+        if hasattr(bpy.data, "batch_remove"):
+            # Purge all
+            purge_orphans()
+            step("purge")
+        else:
+            # Purge all (reload file, old versions can't remove data)
+            bpy.ops.wm.save_as_mainfile(compress=False)
+            for i in range(3):
+                bpy.ops.wm.revert_mainfile()
+            step("purge (revert)")
         # Pack all Textures
         bpy.ops.file.pack_all()
+        step("pack")
         # And save
         bpy.ops.wm.save_as_mainfile(compress=True)
+        step("save")
+    except Exception as e:
+        return str(e) or type(e).__name__
+    return ""
+
 
+def estimate_memory():
+    """ Returns the estimated render memory in bytes, 0 if unknown """
+    try:
+        return memory_estimate.estimate()
     except Exception as e:
-        error_text = e
-        had_error = True
-    # Generate Log file
+        print(f"SheepIt prepare: memory estimate failed: {e}")
+        return 0
+
+
+def write_log(error_text, max_ram=0):
+    """ Generates the log file read by the addon """
     blend_file = bpy.data.filepath
     with open(f"{blend_file}.log", "w") as f:
-        f.write("ERR" if had_error else "OK")
-        if had_error:
+        f.write("ERR" if error_text else "OK")
+        if error_text:
             # write Error
             f.write(f"<->{error_text}")
+        elif max_ram:
+            f.write(f"<->{max_ram}")
+
+
+def main():
+    # optional directory the file was copied from
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    timings = dict()
+    error = prepare(timings, argv[0] if argv else None)
+    write_log(error, 0 if error else estimate_memory())
+    for name, seconds in timings.items():
+        print(f"SheepIt prepare: {name} {seconds:.2f}s")
 
 
 if __name__ == "__main__":
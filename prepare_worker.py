@@ -0,0 +1,80 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Long running Blender process preparing scenes for the Renderfarm
+
+    Started by worker.PrepareWorker with:
+    blender --background --factory-startup --python prepare_worker.py
+        -- <port> <key>
+
+    It connects back to the addon, sends the key and then handles one
+    JSON request per line: {"filepath": ..., "directory": ...}
+    directory is optional, see prepare_scene.prepare()
+    Each is answered with:
+    {"ok": ..., "error": ..., "seconds": ..., "timings": {step: seconds},
+     "max_ram": estimated render memory in bytes} """
+
+
+import bpy
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import prepare_scene  # noqa: E402
+
+
+def handle(request):
+    start = time.monotonic()
+    timings = dict()
+    try:
+        bpy.ops.wm.open_mainfile(filepath=request["filepath"],
+                                 load_ui=False)
+    except Exception as e:
+        error = f"Error opening file: {e}"
+    else:
+        timings["open"] = time.monotonic() - start
+        error = prepare_scene.prepare(timings, request.get("directory"))
+        prepare_scene.write_log(error)
+    max_ram = 0
+    if not error:
+        estimate_start = time.monotonic()
+        max_ram = prepare_scene.estimate_memory()
+        timings["memory estimate"] = time.monotonic() - estimate_start
+    return {
+        "ok": not error,
+        "error": error,
+        "seconds": time.monotonic() - start,
+        "timings": timings,
+        "max_ram": max_ram,
+    }
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:]
+    port, key = int(argv[0]), argv[1]
+    with socket.create_connection(("127.0.0.1", port)) as connection:
+        stream = connection.makefile("rwb")
+        stream.write(f"{key}\n".encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            response = handle(json.loads(line))
+            stream.write(json.dumps(response).encode("utf-8") + b"\n")
+            stream.flush()
+
+
+if __name__ == "__main__":
+    main()
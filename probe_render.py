@@ -0,0 +1,98 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Renders a few small probe frames to estimate the render time
+
+    Started by split_recommender.probe() with:
+    blender <file> --background --factory-startup --python probe_render.py
+        -- <output json> <frame> [<frame> ...]
+
+    Every frame is rendered at PROBE_PERCENTAGE resolution on the CPU
+    once per sample count in PROBE_SAMPLES. The seconds are written to
+    the output file together with the full resolution and samples. """
+
+
+import bpy
+import json
+import sys
+import time
+
+
+PROBE_PERCENTAGE = 25
+PROBE_SAMPLES = (4, 16)
+
+
+def get_samples(scene):
+    if scene.render.engine == 'CYCLES':
+        return scene.cycles.samples
+    return scene.eevee.taa_render_samples
+
+
+def set_samples(scene, samples):
+    if scene.render.engine == 'CYCLES':
+        scene.cycles.samples = samples
+    else:
+        scene.eevee.taa_render_samples = samples
+
+
+def pixels(render):
+    scale = render.resolution_percentage / 100
+    return render.resolution_x * render.resolution_y * scale * scale
+
+
+def probe(frames):
+    scene = bpy.context.scene
+    render = scene.render
+    result = {
+        "engine": render.engine,
+        "full_pixels": pixels(render),
+        "full_samples": get_samples(scene),
+        "samples": PROBE_SAMPLES,
+        "frames": dict(),
+    }
+    render.resolution_percentage = min(render.resolution_percentage,
+                                       PROBE_PERCENTAGE)
+    result["probe_pixels"] = pixels(render)
+    if render.engine == 'CYCLES':
+        scene.cycles.device = 'CPU'
+        # adaptive sampling would stop the probe early
+        if hasattr(scene.cycles, "use_adaptive_sampling"):
+            scene.cycles.use_adaptive_sampling = False
+        if hasattr(scene.cycles, "time_limit"):
+            scene.cycles.time_limit = 0
+    for frame in frames:
+        scene.frame_set(frame)
+        seconds = []
+        for samples in PROBE_SAMPLES:
+            set_samples(scene, samples)
+            start = time.perf_counter()
+            bpy.ops.render.render()
+            seconds.append(time.perf_counter() - start)
+        result["frames"][str(frame)] = seconds
+    return result
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:]
+    output, frames = argv[0], [int(frame) for frame in argv[1:]]
+    try:
+        result = probe(frames)
+    except Exception as e:
+        result = {"error": str(e) or type(e).__name__}
+    with open(output, "w") as f:
+        json.dump(result, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -92,3 +92,41 @@ class SheepItSceneProperties(bpy.types.PropertyGroup):
         max=64,
         step=1
     )
+    frame_split: bpy.props.EnumProperty(
+        name="Split Animation",
+        description="Add long animations as several projects, "
+        "so more members render them at the same time",
+        items=[
+            ("off", "Off", "Add the animation as one project"),
+            ("contiguous", "Contiguous",
+             "Each project renders consecutive frames"),
+            ("interleaved", "Interleaved",
+             "Each project renders every n-th frame, "
+             "giving an early preview of the whole animation"),
+        ]
+    )
+    frame_split_chunks: bpy.props.IntProperty(
+        name="Projects",
+        description="Number of projects, 0 chooses it from the frame count "
+        "and the free project slots",
+        default=0,
+        min=0,
+        max=64
+    )
+
+    # cached result of the split recommender
+    probe_key: bpy.props.StringProperty(default="")
+    probe_seconds: bpy.props.FloatProperty(
+        name="Estimated Render Time",
+        description="Estimated seconds per frame at full resolution "
+        "and samples, from the last probe render",
+        default=0.0,
+        min=0.0)
+
+    use_max_ram: bpy.props.BoolProperty(
+        name="Send Memory Estimate",
+        default=True,
+        description="Estimate the memory needed to render the project, "
+        "so it is only rendered by machines with enough memory")
+    # megabytes estimated while preparing the last upload
+    max_ram_estimate: bpy.props.IntProperty(default=0, min=0)
@@ -13,19 +13,21 @@
 
 
 import bpy
-from . import sheepit
+from . import sheepit, operators, client
 
 
 def register():
     bpy.utils.register_class(LoginPanel)
     bpy.utils.register_class(AddProjectPanel)
     bpy.utils.register_class(ProfilePanel)
+    bpy.utils.register_class(QueuePanel)
 
 
 def unregister():
     bpy.utils.unregister_class(LoginPanel)
     bpy.utils.unregister_class(AddProjectPanel)
     bpy.utils.unregister_class(ProfilePanel)
+    bpy.utils.unregister_class(QueuePanel)
 
 
 class SheepItRenderPanel():
@@ -36,6 +38,14 @@ class SheepItRenderPanel():
     bl_context = "render"
 
 
+def draw_unreachable(layout):
+    """ Shows a warning while requests to the farm fail fast """
+    retry_in = client.unreachable()
+    if retry_in:
+        layout.label(text=f"Farm unreachable, retrying in {retry_in:.0f}s",
+                     icon='ERROR')
+
+
 class LoginPanel(SheepItRenderPanel, bpy.types.Panel):
     """ Login Panel, will be hidden if allready logged in """
     bl_idname = "SHEEPIT_PT_login_panel"
@@ -61,6 +71,7 @@ class AddProjectPanel(SheepItRenderPanel, bpy.types.Panel):
         return preferences.logged_in
 
     def draw(self, context):
+        draw_unreachable(self.layout)
         supported_renderers = {'CYCLES', 'BLENDER_EEVEE'}
         if bpy.context.scene.render.engine in supported_renderers:
             # Renderable by all members
@@ -97,6 +108,12 @@ class AddProjectPanel(SheepItRenderPanel, bpy.types.Panel):
                 settings.prop(context.scene, "frame_end")
                 settings.prop(context.scene, "frame_step")
                 settings.prop(context.scene.sheepit_properties, "mp4")
+                split = self.layout.row(align=True)
+                split.prop(context.scene.sheepit_properties, "frame_split",
+                           expand=True)
+                if context.scene.sheepit_properties.frame_split != 'off':
+                    self.layout.prop(context.scene.sheepit_properties,
+                                     "frame_split_chunks")
             # frame splitting
             split_layers = False
             if bpy.context.scene.render.engine == 'CYCLES' \
@@ -123,6 +140,24 @@ class AddProjectPanel(SheepItRenderPanel, bpy.types.Panel):
                             text="If you split frames, compositor and "
                             "denoising will be disabled.")
 
+            # split recommender
+            recommend = self.layout.row(align=True)
+            recommend.operator("sheepit.recommend_split")
+            recommend.operator("sheepit.recommend_split", text="",
+                               icon='FILE_REFRESH').force = True
+            if context.scene.sheepit_properties.probe_seconds:
+                minutes = context.scene.sheepit_properties.probe_seconds / 60
+                self.layout.label(
+                    text=f"Estimated {minutes:.1f} min per frame "
+                    "on this computer")
+
+            # memory estimate
+            self.layout.prop(context.scene.sheepit_properties, "use_max_ram")
+            max_ram = context.scene.sheepit_properties.max_ram_estimate
+            if max_ram and context.scene.sheepit_properties.use_max_ram:
+                self.layout.label(
+                    text=f"Estimated memory: {max_ram / 1024:.1f} GB")
+
             self.layout.operator("sheepit.send_project")
             status = ""
             progress = ""
@@ -139,6 +174,19 @@ class AddProjectPanel(SheepItRenderPanel, bpy.types.Panel):
                 self.layout.label(text=f"{status}... {progress}")
             elif status:
                 self.layout.label(text=status)
+            if bpy.context.window_manager.get('sheepit', dict()).get(
+                    'upload_active'):
+                self.layout.operator("sheepit.cancel_upload", icon='CANCEL')
+            # timings of the last submission
+            if 'sheepit' in bpy.context.window_manager and \
+                    'trace_summary' in bpy.context.window_manager['sheepit'] \
+                    and not bpy.context.window_manager['sheepit'].get(
+                        'upload_active'):
+                timings = self.layout.box().column(align=True)
+                summary = bpy.context.window_manager['sheepit']['trace_summary']
+                for line in summary.split("\n"):
+                    timings.label(text=line)
+                timings.operator("sheepit.export_trace")
             device_valid = False
             if bpy.context.scene.render.engine == 'CYCLES':
                 device_valid = (context.scene.sheepit_properties.cpu or
@@ -174,6 +222,7 @@ class ProfilePanel(SheepItRenderPanel, bpy.types.Panel):
         preferences = context.preferences.addons[__package__].preferences
 
         self.layout.label(text=f"logged in as {preferences.username}")
+        draw_unreachable(self.layout)
 
         # profile information
         if 'sheepit' in bpy.context.window_manager and \
@@ -187,3 +236,55 @@ class ProfilePanel(SheepItRenderPanel, bpy.types.Panel):
 
         self.layout.operator("sheepit.refresh_profile")
         self.layout.operator("sheepit.logout")
+
+
+class QueuePanel(SheepItRenderPanel, bpy.types.Panel):
+    """ Submission queue for many projects """
+    bl_idname = "SHEEPIT_PT_queue_panel"
+    bl_parent_id = "SHEEPIT_PT_add_project"
+    bl_label = "Queue"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    @classmethod
+    def poll(cls, context):
+        preferences = context.preferences.addons[__package__].preferences
+        return preferences.logged_in
+
+    def draw(self, context):
+        queue = operators.get_queue()
+        stats = queue.stats()
+
+        row = self.layout.row(align=True)
+        row.operator("sheepit.queue_add_scenes")
+        row.operator("sheepit.queue_add_scenes",
+                     text="Queue All Scenes").all_scenes = True
+        self.layout.operator("sheepit.queue_add_files")
+
+        self.layout.label(text=f"{stats['depth']} projects waiting")
+        if stats["states"]:
+            self.layout.label(text=", ".join(
+                f"{count} {state}"
+                for state, count in stats["states"].items()))
+        if stats["upload_rate"]:
+            self.layout.label(
+                text=f"{stats['projects_per_hour']:.0f} projects in the "
+                f"last hour, {stats['upload_rate'] / 1e6:.1f} MB/s")
+        if stats["retries"]:
+            self.layout.label(text=f"{stats['retries']} requests retried")
+        if queue.running and queue.status:
+            self.layout.label(text=queue.status)
+
+        items = self.layout.column(align=True)
+        for item in queue.items[-10:]:
+            text = f"{item['name']}: {item['state']}"
+            if item["error"]:
+                text += f" ({item['error']})"
+            items.label(text=text)
+
+        row = self.layout.row(align=True)
+        if queue.running:
+            row.operator("sheepit.queue_pause")
+        else:
+            row.operator("sheepit.queue_start")
+        row.operator("sheepit.queue_retry")
+        row.operator("sheepit.queue_clear")
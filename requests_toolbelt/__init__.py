@@ -13,7 +13,8 @@ from .adapters import SSLAdapter, SourceAddressAdapter
 from .auth.guess import GuessAuth
 from .multipart import (
     MultipartEncoder, MultipartEncoderMonitor, MultipartDecoder,
-    ImproperBodyPartContentException, NonMultipartContentTypeException
+    StreamingMultipartDecoder, ImproperBodyPartContentException,
+    NonMultipartContentTypeException
     )
 from .streaming_iterator import StreamingIterator
 from .utils.user_agent import user_agent
@@ -27,8 +28,9 @@ __version_info__ = tuple(int(i) for i in __version__.split('.'))
 
 __all__ = [
     'GuessAuth', 'MultipartEncoder', 'MultipartEncoderMonitor',
-    'MultipartDecoder', 'SSLAdapter', 'SourceAddressAdapter',
-    'StreamingIterator', 'user_agent', 'ImproperBodyPartContentException',
-    'NonMultipartContentTypeException', '__title__', '__authors__',
-    '__license__', '__copyright__', '__version__', '__version_info__',
+    'MultipartDecoder', 'StreamingMultipartDecoder', 'SSLAdapter',
+    'SourceAddressAdapter', 'StreamingIterator', 'user_agent',
+    'ImproperBodyPartContentException', 'NonMultipartContentTypeException',
+    '__title__', '__authors__', '__license__', '__copyright__',
+    '__version__', '__version_info__',
 ]
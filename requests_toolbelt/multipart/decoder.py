@@ -10,6 +10,7 @@ This holds all the implementation details of the MultipartDecoder
 
 import sys
 import email.parser
+import tempfile
 from .encoder import encode_with
 from requests.structures import CaseInsensitiveDict
 
@@ -154,3 +155,180 @@ class MultipartDecoder(object):
         content = response.content
         content_type = response.headers.get('content-type', None)
         return cls(content, content_type, encoding)
+
+
+class StreamingBodyPart(object):
+    """
+
+    A ``BodyPart`` whose content is kept in a
+    :class:`tempfile.SpooledTemporaryFile`, created by the
+    ``StreamingMultipartDecoder``. Content up to the decoder's
+    ``spool_size`` stays in memory, larger content is moved to a temporary
+    file on disk.
+
+    ``headers``, ``content``, ``text`` and ``encoding`` work like those of
+    ``BodyPart``, but ``content`` reads the whole part into memory. Use
+    ``read`` to process a large part in pieces, and ``close`` to remove
+    its temporary file.
+
+    """
+
+    def __init__(self, headers, body, encoding):
+        self.encoding = encoding
+        self.headers = CaseInsensitiveDict(headers)
+        #: File-like object holding the content, positioned at its start
+        self.body = body
+
+    def read(self, size=-1):
+        """Read up to ``size`` bytes of the content."""
+        return self.body.read(size)
+
+    @property
+    def content(self):
+        """Content of the ``BodyPart`` in bytes."""
+        self.body.seek(0)
+        return self.body.read()
+
+    @property
+    def text(self):
+        """Content of the ``BodyPart`` in unicode."""
+        return self.content.decode(self.encoding)
+
+    def close(self):
+        self.body.close()
+
+
+class StreamingMultipartDecoder(object):
+    """
+
+    The ``StreamingMultipartDecoder`` object parses a multipart payload
+    arriving in pieces, for example from ``response.iter_content()``, and
+    yields ``StreamingBodyPart`` objects one at a time.
+
+    Unlike the ``MultipartDecoder`` it never holds the whole payload. Only
+    the unparsed end of the last piece is buffered, at most the length of
+    the boundary delimiter is kept back to find a boundary split across
+    two pieces. The content of each part is spooled to disk once it is
+    larger than ``spool_size`` bytes.
+
+    The basic usage is::
+
+        import requests
+        from requests_toolbelt import StreamingMultipartDecoder
+
+        response = requests.get(url, stream=True)
+        for part in StreamingMultipartDecoder.from_response(response):
+            print(part.headers['content-type'])
+            part.close()
+
+    If the multipart content is not from a response, any iterable of bytes
+    can be decoded::
+
+        decoder = StreamingMultipartDecoder(chunks, content_type)
+
+    """
+
+    #: Longest header section of a part, in bytes
+    max_header_size = 64 * 1024
+
+    def __init__(self, iterable, content_type, encoding='utf-8',
+                 spool_size=1024 * 1024):
+        #: Original Content-Type header
+        self.content_type = content_type
+        #: Response body encoding
+        self.encoding = encoding
+        #: Content larger than this is spooled to disk
+        self.spool_size = spool_size
+        self._iterable = iterable
+        self._find_boundary()
+        # The payload starts with the boundary without the CR-LF before it,
+        # one is added so every boundary is found the same way
+        self._delimiter = b''.join((b'\r\n--', self.boundary))
+
+    _find_boundary = MultipartDecoder._find_boundary
+
+    def __iter__(self):
+        chunks = iter(self._iterable)
+        buffer = bytearray(b'\r\n')
+        delimiter = self._delimiter
+        keep = len(delimiter) - 1
+
+        def fill():
+            """Append the next non-empty piece, False at the end."""
+            for chunk in chunks:
+                if chunk:
+                    buffer.extend(chunk)
+                    return True
+            return False
+
+        # Skip the preamble
+        while True:
+            point = buffer.find(delimiter)
+            if point != -1:
+                del buffer[:point + len(delimiter)]
+                break
+            del buffer[:max(0, len(buffer) - keep)]
+            if not fill():
+                return
+
+        while True:
+            # After a boundary, '--' ends the payload
+            while len(buffer) < 2:
+                if not fill():
+                    return
+            if buffer[:2] == b'--':
+                return
+
+            # The header section, starting with the boundary line's CR-LF
+            start = 0
+            while True:
+                point = buffer.find(b'\r\n\r\n', start)
+                if point != -1:
+                    break
+                if len(buffer) > self.max_header_size:
+                    raise ImproperBodyPartContentException(
+                        'header section is longer than {0} bytes'.format(
+                            self.max_header_size)
+                    )
+                start = max(0, len(buffer) - 3)
+                if not fill():
+                    raise ImproperBodyPartContentException(
+                        'content does not contain CR-LF-CR-LF'
+                    )
+            first = bytes(buffer[:point])
+            del buffer[:point + 4]
+            # Skip the rest of the boundary line, like transport padding
+            first = first[first.find(b'\r\n') + 2:] if b'\r\n' in first \
+                else b''
+            headers = {}
+            if first.strip() != b'':
+                headers = _header_parser(first.lstrip(), self.encoding)
+
+            # The content, up to the next boundary
+            body = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            start = 0
+            while True:
+                point = buffer.find(delimiter, start)
+                if point != -1:
+                    body.write(buffer[:point])
+                    del buffer[:point + len(delimiter)]
+                    break
+                # Keep what could be the start of a boundary
+                safe = max(0, len(buffer) - keep)
+                body.write(buffer[:safe])
+                del buffer[:safe]
+                if not fill():
+                    body.close()
+                    raise ImproperBodyPartContentException(
+                        'payload ends without a closing boundary'
+                    )
+            body.seek(0)
+            yield StreamingBodyPart(headers, body, self.encoding)
+
+    @classmethod
+    def from_response(cls, response, encoding='utf-8', chunk_size=64 * 1024,
+                      spool_size=1024 * 1024):
+        """Decode a response requested with ``stream=True``."""
+        content_type = response.headers.get('content-type', None)
+        return cls(response.iter_content(chunk_size), content_type,
+                   encoding, spool_size)
@@ -7,9 +7,12 @@ requests_toolbelt.multipart.encoder
 This holds all of the implementation details of the MultipartEncoder
 
 """
+import collections
 import contextlib
 import io
+import mmap
 import os
+import time
 from uuid import uuid4
 
 import requests
@@ -119,7 +122,7 @@ class MultipartEncoder(object):
         self._len = None
 
         # Our buffer
-        self._buffer = CustomBytesIO(encoding=encoding)
+        self._buffer = ChunkedBuffer()
 
         # Pre-compute each part's headers
         self._prepare_parts()
@@ -181,12 +184,11 @@ class MultipartEncoder(object):
             buffer before the read can be satisfied. This will be strictly
             non-negative
         """
-        amount = read_size - total_len(self._buffer)
+        amount = read_size - len(self._buffer)
         return amount if amount > 0 else 0
 
     def _load(self, amount):
         """Load ``amount`` number of bytes into the buffer."""
-        self._buffer.smart_truncate()
         part = self._current_part or self._next_part()
         while amount == -1 or amount > 0:
             written = 0
@@ -261,9 +263,9 @@ class MultipartEncoder(object):
 
     def _write_closing_boundary(self):
         """Write the bytes necessary to finish a multipart/form-data body."""
-        with reset(self._buffer):
-            self._buffer.seek(-2, 2)
-            self._buffer.write(b'--\r\n')
+        # The boundary written last is still unread, replace its '\r\n'
+        self._buffer.drop_tail(2)
+        self._buffer.append(b'--\r\n')
         return 2
 
     def _write_headers(self, headers):
@@ -314,6 +316,18 @@ class MultipartEncoder(object):
         self._load(bytes_to_load)
         return self._buffer.read(size)
 
+    def readinto(self, b):
+        """Read data from the streaming encoder into a writable buffer.
+
+        :param b: bytearray, memoryview or other writable bytes-like object
+        :returns: int -- the number of bytes written into ``b``, ``0`` once
+            the encoder is exhausted
+        """
+        view = memoryview(b).cast('B')
+        if not self.finished:
+            self._load(self._calculate_load_amount(len(view)))
+        return self._buffer.readinto(view)
+
 
 def IDENTITY(monitor):
     return monitor
@@ -370,13 +384,17 @@ class MultipartEncoderMonitor(object):
 
     """
 
-    def __init__(self, encoder, callback=None):
+    def __init__(self, encoder, callback=None, chunk_size=None):
         #: Instance of the :class:`MultipartEncoder` being monitored
         self.encoder = encoder
 
         #: Optionally function to call after a read
         self.callback = callback or IDENTITY
 
+        #: Optional :class:`AdaptiveChunkSize` choosing how many bytes a
+        #: read returns instead of the size the consumer asked for
+        self.chunk_size = chunk_size
+
         #: Number of bytes already read from the :class:`MultipartEncoder`
         #: instance
         self.bytes_read = 0
@@ -398,11 +416,113 @@ class MultipartEncoderMonitor(object):
         return self.read()
 
     def read(self, size=-1):
+        if self.chunk_size is not None and size is not None and size >= 0:
+            size = self.chunk_size.next_size()
         string = self.encoder.read(size)
         self.bytes_read += len(string)
+        if self.chunk_size is not None:
+            self.chunk_size.record(len(string))
         self.callback(self)
         return string
 
+    def readinto(self, b):
+        written = self.encoder.readinto(b)
+        self.bytes_read += written
+        self.callback(self)
+        return written
+
+
+class AdaptiveChunkSize(object):
+    """Choose how many bytes each read of an upload body returns.
+
+    :mod:`httplib` always reads 8192 bytes and sends whatever the read
+    returns, so returning more coalesces the body into fewer, larger socket
+    writes. The size starts at ``min_size`` and doubles while the
+    throughput, measured from one read to the next and so including the
+    time to send, keeps rising by more than ``gain``. Once it didn't rise
+    for ``patience`` samples in a row the best size is kept, a throughput
+    falling below half of the best one starts the search again from there.
+
+    Every chunk is also capped to ``max_interval`` seconds at the measured
+    throughput, so the callback of a :class:`MultipartEncoderMonitor` runs
+    at least that often on a slow connection. Set ``rate_limit`` to the
+    bytes per second the reads are throttled to, and the cap applies to it
+    at once, before the throughput of a sample reflects a lowered limit.
+
+    .. code-block:: python
+
+        monitor = MultipartEncoderMonitor(encoder, callback,
+                                          chunk_size=AdaptiveChunkSize())
+    """
+
+    def __init__(self, min_size=8192, max_size=4 * 1024 * 1024,
+                 max_interval=0.25, sample_interval=0.1, gain=0.05,
+                 patience=2):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_interval = max_interval
+        self.sample_interval = sample_interval
+        self.gain = gain
+        self.patience = patience
+        #: Bytes the next read returns
+        self.size = min_size
+        #: Bytes per second of the last sample
+        self.rate = None
+        #: Bytes per second the body is throttled to, None if unlimited
+        self.rate_limit = None
+        self._best_rate = None
+        self._best_size = min_size
+        self._growing = True
+        self._flat_samples = 0
+        self._sample_start = None
+        self._sample_bytes = 0
+
+    def next_size(self):
+        """Return the number of bytes the next read should return."""
+        now = time.monotonic()
+        if self._sample_start is None:
+            self._sample_start = now
+        elapsed = now - self._sample_start
+        if elapsed >= self.sample_interval and self._sample_bytes:
+            self._adapt(self._sample_bytes / elapsed)
+            self._sample_start = now
+            self._sample_bytes = 0
+        if self.rate_limit:
+            return max(self.min_size, min(self.size, self._cap(
+                self.rate_limit)))
+        return self.size
+
+    def record(self, amount):
+        """Record that a read returned ``amount`` bytes."""
+        self._sample_bytes += amount
+
+    def _adapt(self, rate):
+        self.rate = rate
+        if self._best_rate is None or \
+                rate > self._best_rate * (1 + self.gain):
+            self._best_rate = rate
+            self._best_size = self.size
+            self._flat_samples = 0
+        elif rate < self._best_rate / 2:
+            # The connection got slower, search again
+            self._best_rate = rate
+            self._best_size = self.size
+            self._flat_samples = 0
+            self._growing = True
+        else:
+            self._flat_samples += 1
+            if self._flat_samples >= self.patience and self._growing:
+                self._growing = False
+                self.size = self._best_size
+        if self._growing:
+            self.size *= 2
+        self.size = max(self.min_size,
+                        min(self.size, self.max_size, self._cap(rate)))
+
+    def _cap(self, rate):
+        """Return the bytes sent in ``max_interval`` at ``rate``."""
+        return int(rate * self.max_interval) // self.min_size * self.min_size
+
 
 def encode_with(string, encoding):
     """Encoding ``string`` with ``encoding`` if necessary.
@@ -485,7 +605,9 @@ class Part(object):
         self.headers = headers
         self.body = body
         self.headers_unread = True
-        self.len = len(self.headers) + total_len(self.body)
+        # The body's size is probed once, then counted down while reading
+        self.body_left = total_len(self.body)
+        self.len = len(self.headers) + self.body_left
 
     @classmethod
     def from_field(cls, field, encoding):
@@ -504,7 +626,7 @@ class Part(object):
         if self.headers_unread:
             to_read += len(self.headers)
 
-        return (to_read + total_len(self.body)) > 0
+        return (to_read + self.body_left) > 0
 
     def write_to(self, buffer, size):
         """Write the requested amount of bytes to the buffer provided.
@@ -521,11 +643,17 @@ class Part(object):
             written += buffer.append(self.headers)
             self.headers_unread = False
 
-        while total_len(self.body) > 0 and (size == -1 or written < size):
+        while self.body_left > 0 and (size == -1 or written < size):
             amount_to_read = size
             if size != -1:
                 amount_to_read = size - written
-            written += buffer.append(self.body.read(amount_to_read))
+            data = self.body.read(amount_to_read)
+            if not data:
+                # The body ended before its probed size
+                self.body_left = 0
+                break
+            self.body_left -= len(data)
+            written += buffer.append(data)
 
         return written
 
@@ -564,16 +692,198 @@ class CustomBytesIO(io.BytesIO):
             self.seek(0, 0)  # We want to be at the beginning
 
 
+class ChunkedBuffer(object):
+    """FIFO byte buffer used by the :class:`MultipartEncoder`.
+
+    Appended data is kept as a queue of chunks instead of one growing
+    :class:`io.BytesIO`, so the unread bytes never have to be moved to the
+    front and the length is tracked instead of found by seeking. A read
+    within one chunk returns the chunk or a slice of it, other reads copy
+    each byte once, either into the returned bytes or into the buffer
+    given to :meth:`readinto`.
+
+    Read-only :class:`memoryview` chunks, as returned by
+    :class:`FileRegionWrapper`, are kept without copying, and reads within
+    them return views as well.
+    """
+
+    def __init__(self):
+        self._chunks = collections.deque()
+        # Position in the first chunk
+        self._offset = 0
+        # Number of unread bytes
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def len(self):
+        return self._len
+
+    def append(self, data):
+        """Add ``data`` to the end of the buffer.
+
+        :returns: int -- the number of bytes added
+        """
+        if not data:
+            return 0
+        if isinstance(data, memoryview) and data.readonly:
+            data = data.cast('B')
+        elif not isinstance(data, bytes):
+            # Copy mutable data, the caller may reuse its buffer
+            data = bytes(data)
+        self._chunks.append(data)
+        self._len += len(data)
+        return len(data)
+
+    def drop_tail(self, amount):
+        """Remove the last ``amount`` unread bytes."""
+        amount = min(amount, self._len)
+        self._len -= amount
+        while amount:
+            last = self._chunks.pop()
+            start = self._offset if not self._chunks else 0
+            if len(last) - start > amount:
+                self._chunks.append(last[:len(last) - amount])
+                break
+            amount -= len(last) - start
+        if not self._chunks:
+            self._offset = 0
+
+    def read(self, size=-1):
+        """Remove and return up to ``size`` bytes, all if ``size`` is -1."""
+        if size is None or size < 0 or size > self._len:
+            size = self._len
+        if not size:
+            return b''
+        first = self._chunks[0]
+        if self._offset == 0 and len(first) == size:
+            self._chunks.popleft()
+            self._len -= size
+            return first
+        if len(first) - self._offset >= size:
+            data = first[self._offset:self._offset + size]
+            self._advance(size)
+            return data
+        pieces = []
+        remaining = size
+        while remaining:
+            chunk = self._chunks[0]
+            amount = min(len(chunk) - self._offset, remaining)
+            pieces.append(
+                memoryview(chunk)[self._offset:self._offset + amount])
+            self._advance(amount)
+            remaining -= amount
+        return b''.join(pieces)
+
+    def readinto(self, b):
+        """Move up to ``len(b)`` bytes into the writable buffer ``b``.
+
+        :returns: int -- the number of bytes moved
+        """
+        view = memoryview(b).cast('B')
+        written = 0
+        while written < len(view) and self._chunks:
+            chunk = self._chunks[0]
+            amount = min(len(chunk) - self._offset, len(view) - written)
+            view[written:written + amount] = \
+                memoryview(chunk)[self._offset:self._offset + amount]
+            written += amount
+            self._advance(amount)
+        return written
+
+    def _advance(self, amount):
+        """Mark ``amount`` bytes of the first chunk as read."""
+        self._offset += amount
+        self._len -= amount
+        if self._offset == len(self._chunks[0]):
+            self._chunks.popleft()
+            self._offset = 0
+
+
 class FileWrapper(object):
     def __init__(self, file_object):
         self.fd = file_object
+        self._left = total_len(self.fd) - self.fd.tell()
+
+    @property
+    def len(self):
+        return self._left
+
+    def read(self, length=-1):
+        data = self.fd.read(length)
+        self._left -= len(data)
+        return data
+
+
+class FileRegionWrapper(object):
+    """Read a region of a file as slices of memory mapped windows.
+
+    Every read returns a read-only :class:`memoryview` of the mapped file,
+    so the file data is never copied into Python objects before it is
+    handed to the socket. Only ``window_size`` bytes are mapped at a time,
+    a window is unmapped once the last view of it is released, which keeps
+    the memory use constant for files of any size.
+
+    .. code-block:: python
+
+        with open('scene.zip', 'rb') as f:
+            encoder = MultipartEncoder({
+                'file': ('scene.zip', FileRegionWrapper(f))
+            })
+
+    :param file_object: a file opened in binary mode, with a ``fileno``
+    :param int offset: (optional), first byte of the region, the current
+        position of ``file_object`` by default
+    :param int length: (optional), bytes in the region, up to the end of
+        the file by default
+    """
+
+    window_size = 8 * 1024 * 1024
+
+    def __init__(self, file_object, offset=None, length=None):
+        self.fd = file_object
+        self._fileno = file_object.fileno()
+        if offset is None:
+            offset = file_object.tell()
+        if length is None:
+            length = os.fstat(self._fileno).st_size - offset
+        self._position = offset
+        self._end = offset + length
+        self._window_start = 0
+        self._view = None
 
     @property
     def len(self):
-        return total_len(self.fd) - self.fd.tell()
+        return self._end - self._position
 
     def read(self, length=-1):
-        return self.fd.read(length)
+        """Return up to ``length`` bytes, less at the end of a window."""
+        remaining = self._end - self._position
+        if length is None or length < 0 or length > remaining:
+            length = remaining
+        if not length:
+            return b''
+        start = self._position - self._window_start
+        if self._view is None or start >= len(self._view):
+            self._map_window()
+            start = self._position - self._window_start
+        data = self._view[start:start + length]
+        self._position += len(data)
+        if self._position == self._end:
+            self._view = None
+        return data
+
+    def _map_window(self):
+        # Mappings have to start at a multiple of the allocation granularity
+        start = self._position - self._position % mmap.ALLOCATIONGRANULARITY
+        size = min(self.window_size, self._end - start)
+        window = mmap.mmap(self._fileno, size, access=mmap.ACCESS_READ,
+                           offset=start)
+        # The mapping stays open while views of it are in use
+        self._view = memoryview(window)
+        self._window_start = start
 
 
 class FileFromURLWrapper(object):
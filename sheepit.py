@@ -14,8 +14,16 @@
 
 import sys
 import os
+import json
+import time
+import random
+import socket
+import threading
+import email.utils
+import requests.adapters
 import requests.sessions
 import requests.cookies
+import urllib3.exceptions
 import html.parser
 from .requests_toolbelt.multipart import encoder
 
@@ -32,17 +40,335 @@ class UploadException(Exception):
     pass
 
 
+class FarmUnreachableException(NetworkException):
+    pass
+
+
+class CancelledException(Exception):
+    pass
+
+
+class CancelToken():
+    """ Cooperative cancellation of uploads
+
+        Pass it to upload_file() or upload_file_resumable(), it is checked
+        for every chunk read from the file and while waiting between
+        retries, so a cancelled upload stops within one chunk. """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """ Raises CancelledException once cancelled """
+        if self._event.is_set():
+            raise CancelledException("Cancelled")
+
+    def wait(self, seconds):
+        """ Sleeps for seconds, returns True early once cancelled """
+        return self._event.wait(seconds)
+
+
+class RetryPolicy():
+    """ When and how often a request to one endpoint is retried
+
+        Delays grow exponentially from base up to cap with full jitter,
+        a random delay between 0 and the exponential value, so many
+        clients failing at the same time don't retry at the same time.
+        A Retry-After sent by the server is waited for at least, unless
+        it is longer than max_retry_after.
+
+        Requests that aren't idempotent, like adding a project, are only
+        retried if the server can't have handled them: when the
+        connection could not be opened or on 429 and 503. """
+
+    retry_statuses = {429, 500, 502, 503, 504}
+    unhandled_statuses = {429, 503}
+
+    def __init__(self, attempts=3, base=1.0, cap=30.0, idempotent=True,
+                 max_retry_after=120.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.idempotent = idempotent
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt, retry_after=None):
+        """ Returns the seconds to wait after the failed attempt
+            (counted from 0) """
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def should_retry(self, response=None, error=None):
+        """ Returns True if a request ending with response or with the
+            requests exception error may be sent again """
+        if error is not None:
+            if isinstance(error, requests.exceptions.ConnectTimeout) or \
+                    _connection_refused(error):
+                return True
+            if isinstance(error, (requests.exceptions.ConnectionError,
+                                  requests.exceptions.Timeout)):
+                return self.idempotent
+            return False
+        if self.idempotent:
+            return response.status_code in self.retry_statuses
+        return response.status_code in self.unhandled_statuses
+
+
+class RetryBudget():
+    """ Limits retries shared by all endpoints of a client
+
+        Every retry takes one token, every successful request gives back
+        refill tokens, so while the server keeps failing only a few
+        retries are added on top of the normal requests. """
+
+    def __init__(self, capacity=10.0, refill=0.2):
+        self.capacity = capacity
+        self.refill = refill
+        self.tokens = capacity
+        self._lock = threading.Lock()
+
+    def withdraw(self):
+        """ Returns True if a retry is allowed """
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.refill)
+
+
+class CircuitBreaker():
+    """ Fails fast while the server is unreachable
+
+        After failure_threshold requests in a row failed to connect, time
+        out or got a server error, the breaker opens and requests fail at
+        once with FarmUnreachableException. After reset_timeout seconds
+        a single request is let through as a probe (half open), its
+        success closes the breaker, its failure opens it again. """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """ True while requests fail fast, without reserving a probe """
+        return self.state != self.CLOSED and self.retry_in() > 0
+
+    def retry_in(self):
+        """ Returns the seconds until the next probe is allowed """
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout
+                   - time.monotonic())
+
+    def allow(self):
+        """ Returns True if a request may be sent, a True in the half
+            open state makes the caller the probe """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if self.retry_in() > 0:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """ Ends a request that neither reached nor missed the server """
+        with self._lock:
+            self._probing = False
+
+
+_breakers = dict()
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(url):
+    """ Returns the CircuitBreaker shared by all clients of url """
+    with _breakers_lock:
+        if url not in _breakers:
+            _breakers[url] = CircuitBreaker()
+        return _breakers[url]
+
+
+# Retry policies of the endpoints used by Sheepit
+RETRY_POLICIES = {
+    "login": RetryPolicy(attempts=3),
+    "logout": RetryPolicy(attempts=2),
+    "login check": RetryPolicy(attempts=3),
+    "profile": RetryPolicy(attempts=3),
+    "token": RetryPolicy(attempts=4),
+    # whole uploads are repeated by upload_file_resumable()
+    "upload": RetryPolicy(attempts=5, base=2.0, cap=60.0),
+    "upload progress": RetryPolicy(attempts=2, base=0.2, cap=1.0),
+    "add job form": RetryPolicy(attempts=4),
+    "add job": RetryPolicy(attempts=4, idempotent=False),
+    "warm up": RetryPolicy(attempts=1),
+}
+
+
 class Sheepit():
     """ Api for Managing your SheepIt Account
         and uploading Project """
 
-    def __init__(self):
-        self.domain = "www.sheepit-renderfarm.com"
+    # seconds to open a connection for an upload or adding a project
+    connect_timeout = 10.0
+    # seconds to wait for the response once everything was sent
+    read_timeout = 120.0
+    # an upload sending no bytes for this many seconds is restarted
+    stall_timeout = 60.0
+    # optional bandwidth.BandwidthLimiter shaping the uploads
+    bandwidth = None
+
+    def __init__(self, domain="www.sheepit-renderfarm.com",
+                 scheme="https", port=None, retry_policies=None,
+                 retry_budget=None, circuit_breaker=None):
+        self.domain = domain
+        self.url = f"{scheme}://{domain}"
+        if port:
+            self.url += f":{port}"
+        self.address = (domain, port or (443 if scheme == "https" else 80))
         self.session = requests.session()
+        # can close the connection of a stalled or cancelled upload
+        self.adapter = AbortableAdapter()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.retry_policies = dict(RETRY_POLICIES)
+        if retry_policies:
+            self.retry_policies.update(retry_policies)
+        self.retry_budget = retry_budget or RetryBudget()
+        self.circuit_breaker = circuit_breaker or \
+            get_circuit_breaker(self.url)
+        self._stats = dict()
+        self._stats_lock = threading.Lock()
 
     def __del__(self):
-        self.session.close()
-        del self.session
+        self.close()
+
+    def close(self):
+        """ Closes all pooled connections of this client """
+        if hasattr(self, "session"):
+            self.session.close()
+            del self.session
+
+    def _count(self, endpoint, name):
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                endpoint, {"requests": 0, "retries": 0, "failures": 0})
+            stats[name] += 1
+
+    def retry_stats(self):
+        """ Returns the number of requests, retries and failed requests
+            per endpoint and the remaining retry budget """
+        with self._stats_lock:
+            stats = {endpoint: dict(counts)
+                     for endpoint, counts in self._stats.items()}
+        stats["budget"] = self.retry_budget.tokens
+        return stats
+
+    def _request(self, endpoint, method, path, retry=True, aborted=None,
+                 **kwargs):
+        """ Sends a request to path on the server, it is retried as the
+            RetryPolicy of endpoint allows
+
+            aborted is an optional threading.Event, e.g. the one of a
+            StallWatchdog. A request failing after it was set was aborted
+            by the client and isn't counted against the server.
+
+            Returns the response, unless the last attempt failed
+
+            Raises:
+            NetworkException if the server could not be reached or
+                responded with an error worth retrying
+            FarmUnreachableException at once while the CircuitBreaker
+                is open """
+        policy = self.retry_policies[endpoint]
+        breaker = self.circuit_breaker
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count(endpoint, "failures")
+                raise FarmUnreachableException(
+                    "SheepIt! Renderfarm unreachable, "
+                    f"trying again in {breaker.retry_in():.0f}s")
+            response, error = None, None
+            self._count(endpoint, "requests")
+            try:
+                response = self.session.request(
+                    method, f"{self.url}/{path}", **kwargs)
+            except requests.exceptions.RequestException as e:
+                if aborted is not None and aborted.is_set():
+                    breaker.release()
+                    raise NetworkException("Request aborted")
+                error = e
+            except BaseException:
+                breaker.release()
+                raise
+            if error is not None or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if not policy.should_retry(response, error):
+                if error is not None:
+                    self._count(endpoint, "failures")
+                    raise _network_exception(error)
+                self.retry_budget.deposit()
+                return response
+            retry_after = None
+            if response is not None:
+                retry_after = _retry_after(response)
+            if not retry or attempt + 1 >= policy.attempts or \
+                    (retry_after or 0) > policy.max_retry_after or \
+                    not self.retry_budget.withdraw():
+                self._count(endpoint, "failures")
+                if error is not None:
+                    raise _network_exception(error)
+                raise NetworkException(
+                    f"Server responded with {response.status_code}")
+            self._count(endpoint, "retries")
+            time.sleep(policy.delay(attempt, retry_after))
+            attempt += 1
 
     def login(self, username, password):
         """ This method try's logging in with the provided
@@ -54,18 +380,13 @@ class Sheepit():
             Raises:
             NetworkError on a failed connection
             LoginError on a Wrong username and/or password """
-        try:
-            r = self.session.post(f"https://{self.domain}/ajax.php",
-                                  data={"login": username,
-                                        "password": password,
-                                        "do_login": "do_login",
-                                        "timezone": "Europe/Berlin",
-                                        "account_login": "account_login"},
-                                  timeout=5)
-        except requests.exceptions.Timeout:
-            raise NetworkException("Timed out")
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+        r = self._request("login", "POST", "ajax.php",
+                          data={"login": username,
+                                "password": password,
+                                "do_login": "do_login",
+                                "timezone": "Europe/Berlin",
+                                "account_login": "account_login"},
+                          timeout=5)
         if r.text != "OK":
             raise LoginException("Wrong Username and/or Password")
         return
@@ -80,17 +401,10 @@ class Sheepit():
             NetworkError on a failed connection,
                 cookies will still be cleared """
         try:
-            self.session.get(
-                f"https://{self.domain}/account.php?mode=logout", timeout=5)
-        except requests.exceptions.Timeout:
-            raise NetworkException("Timed out")
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+            self._request("logout", "GET", "account.php?mode=logout",
+                          timeout=5)
         finally:
-            try:
-                self.session.cookies.clear(domain=self.domain)
-            except KeyError:
-                pass
+            self.clear_session()
 
     def get_profile_information(self):
         """ This methode returns a dict with the folowing profile attributes:
@@ -99,14 +413,8 @@ class Sheepit():
 
             Raises:
             NetworkException on a failed connection """
-        r = None
-        try:
-            r = self.session.get(
-                f"https://{self.domain}/account.php?mode=profile", timeout=5)
-        except requests.exceptions.Timeout:
-            raise NetworkException("Timed out")
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+        r = self._request("profile", "GET", "account.php?mode=profile",
+                          timeout=5)
 
         p = ProfileParser()
         p.feed(str(r.text))
@@ -125,13 +433,7 @@ class Sheepit():
             NetworkError on a failed connection
             UploadException if the maximum number of simultaneous
                 projects had been reached """
-        try:
-            r = self.session.get(f"https://{self.domain}/getstarted.php",
-                                 timeout=5)
-        except requests.exceptions.Timeout:
-            raise NetworkException("Timed out")
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+        r = self._request("token", "GET", "getstarted.php", timeout=5)
 
         p = TokenParser()
         p.feed(str(r.text))
@@ -143,51 +445,146 @@ class Sheepit():
             )
         return p.token
 
-    def upload_file(self, token, path_to_file):
+    def upload_file(self, token, path_to_file, callback=None, cancel=None):
         """ Uploads the selected file to the Server
 
             Use request_upload_token() to get a token,
             get_upload_progress() to track the upload progress
             and add_job() to add the uploaded project
 
+            callback is called with an UploadProgress while the file
+            is being sent, at most every UploadProgress.interval seconds
+            cancel is an optional CancelToken stopping the upload
+
+            The body is read no faster than the BandwidthLimiter in
+            bandwidth allows, if one is set
+
             Raises:
-            NetworkError on a failed connection """
+            NetworkError on a failed connection, a timeout or if no bytes
+                were sent for stall_timeout seconds
+            CancelledException if cancel was cancelled """
         with open(path_to_file, "rb") as f:
+            form = encoder.MultipartEncoder({
+                "step": "1",
+                "transfertmethod": "File",
+                "token": token,
+                "PHP_SESSION_UPLOAD_PROGRESS": token,
+                "mode": "add",
+                # sent from a memory map, without copying it in Python
+                "addjob_archive": (os.path.split(path_to_file)[1],
+                                   encoder.FileRegionWrapper(f))
+            })
+            progress = UploadProgress(form.len)
+            # the watchdog closes the connection of the request while it
+            # is blocked sending or waiting for the response
+            watchdog = StallWatchdog(form.len, self.stall_timeout,
+                                     self.connect_timeout, cancel,
+                                     on_abort=self.adapter.abort)
+
+            def upload_sockets():
+                sock = self.adapter.socket(watchdog.thread)
+                return [] if sock is None else [sock]
+
+            limiter = self.bandwidth
+            if limiter is not None and not limiter.enabled:
+                limiter = None
+
+            # larger reads while they speed up the upload, but short
+            # enough for progress, throttling and cancelling to react
+            chunk_size = encoder.AdaptiveChunkSize()
+
+            def on_read(monitor):
+                sent = watchdog.bytes_read
+                watchdog.update(monitor.bytes_read)
+                if limiter is not None:
+                    # waiting for the limit is no stall
+                    watchdog.pause()
+                    try:
+                        limiter.throttle(monitor.bytes_read - sent,
+                                         watchdog.aborted)
+                    finally:
+                        watchdog.resume()
+                    progress.limit = limiter.current_limit()
+                    chunk_size.rate_limit = progress.limit
+                if progress.update(monitor.bytes_read) and callback:
+                    callback(progress)
+
+            monitor = encoder.MultipartEncoderMonitor(form, on_read,
+                                                      chunk_size)
+            headers = {"Prefer": "respond-async",
+                       "Content-Type": monitor.content_type}
+            # the consumed stream can't be sent again,
+            # upload_file_resumable() retries with a new one
+            if limiter is not None:
+                limiter.start(self.address, upload_sockets)
             try:
-                form = encoder.MultipartEncoder({
-                    "step": "1",
-                    "transfertmethod": "File",
-                    "token": token,
-                    "PHP_SESSION_UPLOAD_PROGRESS": token,
-                    "mode": "add",
-                    "addjob_archive": (os.path.split(path_to_file)[1], f)
-                })
-                headers = {"Prefer": "respond-async",
-                           "Content-Type": form.content_type}
-                r = self.session.post(
-                    f"https://{self.domain}/jobs.php", data=form, headers=headers)
-            except requests.exceptions.RequestException as e:
-                raise NetworkException(
-                    "Failed connecting to the sheepit server")
+                r = watchdog.run(
+                    self._request, "upload", "POST", "jobs.php",
+                    retry=False, aborted=watchdog.aborted, data=monitor,
+                    headers=headers,
+                    timeout=(self.connect_timeout, self.read_timeout))
+            finally:
+                if limiter is not None:
+                    limiter.stop(upload_sockets)
+        if r.status_code >= 500:
+            raise NetworkException(
+                f"Upload failed, server responded with {r.status_code}")
+
+    def upload_file_resumable(self, token, path_to_file, callback=None,
+                              cancel=None):
+        """ Uploads the selected file like upload_file(), but retries
+            failed uploads as the "upload" RetryPolicy allows
+
+            Every attempt and the bytes the server confirmed are recorded
+            in an UploadJournal next to the file, it is removed after a
+            successful upload. The server only accepts whole archives,
+            so each retry sends the file again from the start, but the
+            already prepared file is reused.
+
+            Returns the number of attempts needed
+
+            Raises:
+            NetworkError if the last attempt failed
+            CancelledException if cancel was cancelled """
+        policy = self.retry_policies["upload"]
+        journal = UploadJournal(path_to_file, token)
+        for attempt in range(policy.attempts):
+            journal.start_attempt()
+            try:
+                self.upload_file(token, path_to_file, callback, cancel)
+            except NetworkException as e:
+                try:
+                    progress = self.get_upload_progress(token)
+                except NetworkException:
+                    progress = None
+                journal.fail_attempt(progress, str(e))
+                if attempt == policy.attempts - 1 or \
+                        not self.retry_budget.withdraw():
+                    raise
+                self._count("upload", "retries")
+                if cancel is None:
+                    time.sleep(policy.delay(attempt))
+                elif cancel.wait(policy.delay(attempt)):
+                    cancel.check()
+            else:
+                journal.remove()
+                return attempt + 1
 
     def get_upload_progress(self, token):
         """ Returns the upload progress in percent
 
             Raises:
             NetworkError on a failed connection """
+        r = self._request("upload progress", "POST", "ajax.php", data={
+            "addjob": "addjob",
+            "upload_progress": "upload_progress",
+            "token": token
+        }, timeout=5)
         try:
-            r = self.session.post(
-                f"https://{self.domain}/ajax.php", data={
-                    "addjob": "addjob",
-                    "upload_progress": "upload_progress",
-                    "token": token
-                },
-                timeout=5
-            )
             dict = eval(r.content)
+            if not dict['content_length']:
+                return
             return dict['bytes_processed']/dict['content_length']
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
         except SyntaxError:
             return
 
@@ -200,9 +597,12 @@ class Sheepit():
 
             Use request_upload_token() to get a token
             and upload_file() to upload the file
+            max_ram is the expected render memory in megabytes, so the
+            project is only given to machines with enough memory
 
             Raises:
-            NetworkError on a failed connection """
+            NetworkError on a failed connection
+            UploadException if no uploaded file belongs to the token """
         param_start_frame = 0
         param_end_frame = 0
         param_step_frame = 1
@@ -221,14 +621,15 @@ class Sheepit():
         else:
             param_start_frame = still_frame
 
-        try:
-            r = self.session.get(
-                f"https://{self.domain}/jobs.php?mode=add&step=2&token={token}")
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+        timeout = (self.connect_timeout, self.read_timeout)
+        r = self._request("add job form", "GET",
+                          f"jobs.php?mode=add&step=2&token={token}",
+                          timeout=timeout)
         parser = AddJobParser()
         parser.feed(str(r.text))
         parser.close()
+        if not parser.data['addjob_archive_0']:
+            raise UploadException("No uploaded file found for this token")
 
         compute_method = 0
         if parser.data['addjob_engine_0'] == "BLENDER_EEVEE":
@@ -255,7 +656,7 @@ class Sheepit():
             "end_frame": param_end_frame,
             "step_frame": param_step_frame,
             "archive": parser.data['addjob_archive_0'],
-            "max_ram_optional": "",
+            "max_ram_optional": max_ram or "",
             "path": parser.data['addjob_path_0'],
             "framerate": parser.data['addjob_framerate_0'],
             "split_tiles": param_split_tiles,
@@ -266,11 +667,8 @@ class Sheepit():
         }
         if param_split_layers:
             settings["split_samples"] = param_split_layers
-        try:
-            r = self.session.post(
-                f"https://{self.domain}/ajax.php", data=settings)
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+        self._request("add job", "POST", "ajax.php", data=settings,
+                      timeout=timeout)
 
     def import_session(self, dict):
         """ Imports all cookies from a dictionary
@@ -283,6 +681,15 @@ class Sheepit():
                 value=value
             ))
 
+    def clear_session(self):
+        """ Removes all cookies of the SheepIt domain
+
+        Use import_session() to load new ones """
+        try:
+            self.session.cookies.clear(domain=self.domain)
+        except KeyError:
+            pass
+
     def export_session(self):
         """ Exports all cookies as a dictionary
 
@@ -293,6 +700,16 @@ class Sheepit():
                 cookies[cookie.name] = cookie.value
         return cookies
 
+    def warm_up(self):
+        """ Opens or refreshes a pooled connection to the server,
+            so a following request can skip the connection setup
+
+            Failures are ignored, the next real request reports them """
+        try:
+            self._request("warm up", "HEAD", "", timeout=5)
+        except NetworkException:
+            pass
+
     def is_logged_in(self):
         """ Returns True if logged in
 
@@ -302,13 +719,314 @@ class Sheepit():
         if not cookies:
             # Return if cookies empty
             return False
+        r = self._request("login check", "GET", "account.php?mode=login",
+                          timeout=5)
+        # return True if redirected to main page
+        return r.url == f"{self.url}/"
+
+
+def _network_exception(error):
+    if isinstance(error, requests.exceptions.Timeout):
+        return NetworkException("Timed out")
+    return NetworkException("Failed connecting to the sheepit server")
+
+
+def _connection_refused(error):
+    """ Returns True if error happened before the request was sent """
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _retry_after(response):
+    """ Returns the seconds of a Retry-After header, None without one """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class UploadProgress():
+    """ Progress of a running upload, counted on the client side
+
+        Throughput is an exponentially weighted moving average of the
+        rate measured over each interval, the ETA is derived from it.
+        limit is the bandwidth limit in bytes per second while one
+        applies, so the effective rate can be shown next to it """
+
+    interval = 0.5
+
+    def __init__(self, total, smoothing=0.3):
+        self.total = total
+        self.smoothing = smoothing
+        self.bytes_sent = 0
+        # bytes per second
+        self.rate = None
+        self.limit = None
+        self.start_time = time.monotonic()
+        self._sample_time = self.start_time
+        self._sample_bytes = 0
+
+    def update(self, bytes_sent):
+        """ Records the bytes sent so far
+
+            Returns True if a new rate sample was taken """
+        self.bytes_sent = bytes_sent
+        now = time.monotonic()
+        elapsed = now - self._sample_time
+        if elapsed < self.interval and bytes_sent < self.total:
+            return False
+        if elapsed > 0:
+            rate = (bytes_sent - self._sample_bytes) / elapsed
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate += self.smoothing * (rate - self.rate)
+        self._sample_time = now
+        self._sample_bytes = bytes_sent
+        return True
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return 0.0
+        return min(1.0, self.bytes_sent / self.total)
+
+    @property
+    def eta(self):
+        """ Estimated seconds left, None while unknown """
+        if not self.rate:
+            return None
+        return (self.total - self.bytes_sent) / self.rate
+
+    def __str__(self):
+        text = f"{self.fraction * 100:.0f}%"
+        if self.rate:
+            text += f", {self.rate / 1e6:.1f} MB/s"
+            if self.limit:
+                text += f" of {self.limit / 1e6:.1f} MB/s limit"
+        eta = self.eta
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            text += f", {minutes}:{seconds:02d} left"
+        return text
+
+
+class AbortableAdapter(requests.adapters.HTTPAdapter):
+    """ Transport adapter that can close the connection of a request
+        from another thread
+
+        The pooled connection each thread takes is recorded until it is
+        put back. abort() shuts down the socket of a thread's connection,
+        its request blocked sending or receiving fails at once and the
+        connection is dropped from the pool. Connections through a proxy
+        are not tracked. """
+
+    def __init__(self, *args, **kwargs):
+        self._connections = dict()
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def tracked(pool_class):
+            class TrackedPool(pool_class):
+                def _get_conn(self, *args, **kwargs):
+                    connection = super()._get_conn(*args, **kwargs)
+                    with adapter._lock:
+                        adapter._connections[threading.get_ident()] = \
+                            connection
+                    return connection
+
+                def _put_conn(self, connection):
+                    with adapter._lock:
+                        adapter._connections.pop(threading.get_ident(),
+                                                 None)
+                    super()._put_conn(connection)
+            return TrackedPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: tracked(pool_class) for scheme, pool_class
+            in self.poolmanager.pool_classes_by_scheme.items()}
+
+    def socket(self, thread):
+        """ Returns the socket of the connection thread uses, None if it
+            has no connected one """
+        if thread is None:
+            return None
+        with self._lock:
+            connection = self._connections.get(thread.ident)
+        return getattr(connection, "sock", None)
+
+    def abort(self, thread):
+        """ Shuts down the connection the request of thread uses """
+        sock = self.socket(thread)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # already closed
+            pass
+
+
+class StallWatchdog():
+    """ Aborts a request whose body stopped being sent
+
+        The request runs in a helper thread while the calling thread
+        watches the number of bytes read from the body. If it doesn't
+        grow for stall_timeout seconds, the call fails at once, on_abort
+        is called with the helper thread to close its connection, e.g.
+        AbortableAdapter.abort, and the thread is given join_timeout
+        seconds to end.
+        Without on_abort, the next read of the helper thread raises.
+        Before the first byte connect_timeout is allowed in addition,
+        once the whole body was read the read timeout of the request
+        applies instead. A cancelled CancelToken aborts the same way. """
+
+    join_timeout = 5.0
+
+    class Aborted(Exception):
+        pass
+
+    def __init__(self, total, stall_timeout, connect_timeout=0.0,
+                 cancel=None, on_abort=None):
+        self.total = total
+        self.stall_timeout = stall_timeout
+        self.cancel = cancel
+        self.on_abort = on_abort
+        # the helper thread of run()
+        self.thread = None
+        self.bytes_read = 0
+        self.last_progress = time.monotonic() + connect_timeout
+        self.paused = False
+        self.aborted = threading.Event()
+
+    def update(self, bytes_read):
+        """ Called for every read of the body """
+        if self.aborted.is_set():
+            raise self.Aborted()
+        if self.cancel is not None:
+            self.cancel.check()
+        if bytes_read != self.bytes_read:
+            self.bytes_read = bytes_read
+            self.last_progress = time.monotonic()
+
+    def pause(self):
+        """ Called while the body is held back on purpose, e.g. by the
+            bandwidth limit """
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.last_progress = time.monotonic()
+
+    @property
+    def stalled(self):
+        return not self.paused and self.bytes_read < self.total and \
+            time.monotonic() - self.last_progress > self.stall_timeout
+
+    def run(self, function, *args, **kwargs):
+        """ Returns function(*args, **kwargs) unless the body stalls
+
+            Raises:
+            NetworkException if the body stalled
+            CancelledException if the CancelToken was cancelled """
+        done = threading.Event()
+        outcome = dict()
+
+        def target():
+            try:
+                outcome["result"] = function(*args, **kwargs)
+            except BaseException as e:
+                outcome["error"] = e
+            done.set()
+
+        thread = threading.Thread(target=target, name="sheepit-request",
+                                  daemon=True)
+        self.thread = thread
+        thread.start()
+        while not done.wait(min(0.1, self.stall_timeout / 4)):
+            if self.cancel is not None and self.cancel.cancelled:
+                # the blocked request may not read again for a while
+                self._abort(thread)
+                self.cancel.check()
+            if self.stalled:
+                self._abort(thread)
+                raise NetworkException(
+                    f"Upload stalled, no data sent for "
+                    f"{self.stall_timeout:.0f}s")
+        if "error" in outcome:
+            if isinstance(outcome["error"], self.Aborted):
+                raise NetworkException("Upload aborted")
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _abort(self, thread):
+        self.aborted.set()
+        if self.on_abort is not None:
+            self.on_abort(thread)
+            thread.join(self.join_timeout)
+
+
+class UploadJournal():
+    """ Records the upload attempts of a file in {file}.upload.json
+
+        The journal is reset when the file or the token changed """
+
+    def __init__(self, path_to_file, token):
+        self.path = f"{path_to_file}.upload.json"
+        stat = os.stat(path_to_file)
+        self.data = {
+            "token": token,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "confirmed": 0,
+            "attempts": 0,
+            "errors": [],
+        }
+        try:
+            with open(self.path, "r") as f:
+                old = json.load(f)
+            if all(old.get(key) == self.data[key]
+                   for key in ("token", "size", "mtime")):
+                self.data = old
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def confirmed(self):
+        """ Number of bytes the server confirmed in the last attempt """
+        return self.data["confirmed"]
+
+    def start_attempt(self):
+        self.data["attempts"] += 1
+        self.save()
+
+    def fail_attempt(self, progress, error):
+        """ progress is the fraction returned by get_upload_progress() """
+        if progress:
+            self.data["confirmed"] = int(progress * self.data["size"])
+        self.data["errors"].append(error)
+        self.save()
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.data, f)
+
+    def remove(self):
         try:
-            r = self.session.get(
-                f"https://{self.domain}/account.php?mode=login", timeout=5)
-            # return True if redirected to main page
-            return r.url == f"https://{self.domain}/"
-        except requests.exceptions.RequestException:
-            raise NetworkException("Failed connecting to the sheepit server")
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
 
 
 class ProfileParser(html.parser.HTMLParser):
@@ -0,0 +1,115 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" Recommends how frames should be split, based on a local probe render
+
+    The render time of a frame is modeled as a fixed part (scene sync,
+    BVH build...) plus a part growing with pixels * samples. Rendering
+    each probe frame with two sample counts gives both parts. """
+
+
+import json
+import math
+import os
+import subprocess
+import tempfile
+import time
+
+
+PROBE_SCRIPT = os.path.join(os.path.dirname(__file__), "probe_render.py")
+
+# The Renderfarm stops tiles rendering longer than this
+TILE_LIMIT = 30 * 60
+# Aim well below the limit, farm machines may be slower than this one
+TARGET_SECONDS = TILE_LIMIT / 2
+
+# anim_split choices and the number of tiles they create
+TILE_SPLITS = (("1", 1), ("2", 4), ("4", 16), ("5", 25), ("6", 36))
+
+
+def probe_frames(start, end, count=3):
+    """ Returns up to count frames spread over start..end """
+    if end <= start:
+        return [start]
+    count = min(count, end - start + 1)
+    if count == 1:
+        return [start]
+    return sorted({start + round(i * (end - start) / (count - 1))
+                   for i in range(count)})
+
+
+def probe(blender_exe, filepath, frames, abort=None):
+    """ Renders the probe frames of filepath in a new Blender process
+
+        abort is an optional threading.Event, setting it kills the process
+        Returns the result of probe_render.py, with "error" on failure """
+    handle, output = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        process = subprocess.Popen([
+            blender_exe,
+            filepath,
+            "--background",
+            "--factory-startup",
+            "--python",
+            PROBE_SCRIPT,
+            "--",
+            output,
+        ] + [str(frame) for frame in frames])
+        while process.poll() is None:
+            if abort is not None and abort.is_set():
+                process.kill()
+                process.wait()
+                return {"error": "aborted"}
+            time.sleep(0.1)
+        try:
+            with open(output, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"error": "Probe render failed"}
+    finally:
+        os.remove(output)
+
+
+def estimate(result):
+    """ Returns the estimated seconds of the slowest frame at full
+        resolution and samples """
+    low, high = result["samples"]
+    scale = result["full_pixels"] / max(1, result["probe_pixels"])
+    estimates = []
+    for seconds_low, seconds_high in result["frames"].values():
+        per_sample = max(0.0, (seconds_high - seconds_low) / (high - low))
+        fixed = max(0.0, seconds_low - per_sample * low)
+        estimates.append(
+            fixed + per_sample * result["full_samples"] * scale)
+    return max(estimates)
+
+
+def recommend(seconds, split_layers, animation):
+    """ Returns the scene properties to set for frames taking seconds
+
+        The smallest split keeping every part below TARGET_SECONDS is
+        chosen, as each part adds overhead on the farm. """
+    if split_layers:
+        layers = math.ceil(seconds / TARGET_SECONDS)
+        if animation:
+            return {"anim_layer_split": max(1, min(64, layers))}
+        return {"still_layer_split": max(4, min(32, layers))}
+    if not animation:
+        # single frames are always split in 8x8 tiles
+        return dict()
+    for split, tiles in TILE_SPLITS:
+        if seconds / tiles <= TARGET_SECONDS:
+            return {"anim_split": split}
+    return {"anim_split": TILE_SPLITS[-1][0]}
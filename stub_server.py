@@ -0,0 +1,236 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+""" A local stand-in for the SheepIt server
+
+    It answers the same pages sheepit.Sheepit uses, so the whole API can
+    be exercised offline:
+
+        with StubServer() as server:
+            session = sheepit.Sheepit(**server.client_arguments())
+            session.login(server.username, server.password)
+
+    Run this file directly to serve it until interrupted. """
+
+
+import http.server
+import json
+import threading
+import urllib.parse
+import uuid
+
+
+PROFILE_PAGE = """<html><body><dl>
+<dt>Projects created</dt><dd>{projects}</dd>
+<dt>Frames ordered</dt><dd>0</dd>
+<dt>Rendered frames</dt><dd>0</dd>
+<dt>Accumulated render</dt><dd>0</dd>
+<dt>Rank</dt><dd>1</dd>
+<dt>Points</dt><dd>1000</dd>
+<dt>Team</dt><dd>none</dd>
+<dt>Registration</dt><dd>today</dd>
+</dl></body></html>"""
+
+ADD_JOB_PAGE = """<html><body><form>
+<input id="addjob_engine_0" value="CYCLES">
+<input id="addjob_archive_0" value="{archive}">
+<input id="addjob_path_0" value="{archive}">
+<input id="addjob_framerate_0" value="24">
+<input id="addjob_cycles_samples_0" value="128">
+<input id="addjob_samples_pixel_0" value="1">
+<input id="addjob_image_extension_0" value=".png">
+</form></body></html>"""
+
+
+class StubServer():
+    """ Threaded HTTP server imitating the SheepIt pages on localhost """
+
+    def __init__(self, username="user", password="password",
+                 max_projects=2, reuse_tokens=False, port=0):
+        self.username = username
+        self.password = password
+        self.max_projects = max_projects
+        # whether a token can add more than one project
+        self.reuse_tokens = reuse_tokens
+        self.sessions = set()
+        # token: {"size": uploaded bytes, "name": archive name}
+        self.uploads = dict()
+        # list of the posted add job settings
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", port), _make_handler(self))
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+
+    def client_arguments(self):
+        """ Keyword arguments for sheepit.Sheepit() to use this server """
+        return {"domain": "127.0.0.1", "scheme": "http", "port": self.port}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def _make_handler(server):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def session_id(self):
+            cookies = self.headers.get("Cookie", "")
+            for cookie in cookies.split(";"):
+                name, _, value = cookie.strip().partition("=")
+                if name == "sessid" and value in server.sessions:
+                    return value
+            return None
+
+        def reply(self, body, status=200, headers=None):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_form(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            return dict(urllib.parse.parse_qsl(body.decode("utf-8")))
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            logged_in = self.session_id() is not None
+            if url.path == "/account.php":
+                mode = query.get("mode")
+                if mode == "login" and logged_in:
+                    return self.reply("", 302, {"Location": "/"})
+                if mode == "logout":
+                    with server.lock:
+                        server.sessions.discard(self.session_id())
+                    return self.reply("logged out")
+                if mode == "profile" and logged_in:
+                    return self.reply(PROFILE_PAGE.format(
+                        projects=len(server.jobs)))
+                return self.reply("<html>login</html>")
+            if url.path == "/getstarted.php":
+                token = ""
+                with server.lock:
+                    if logged_in and len(server.jobs) < server.max_projects:
+                        token = uuid.uuid4().hex
+                        server.uploads[token] = {"size": 0, "name": ""}
+                return self.reply(
+                    f'<input name="token" value="{token}">' if token else "")
+            if url.path == "/jobs.php":
+                upload = server.uploads.get(query.get("token"))
+                archive = upload["name"] if upload else ""
+                return self.reply(ADD_JOB_PAGE.format(archive=archive))
+            return self.reply("<html>home</html>")
+
+        def do_POST(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == "/jobs.php":
+                return self.receive_upload()
+            form = self.read_form()
+            if "do_login" in form:
+                if form.get("login") == server.username and \
+                        form.get("password") == server.password:
+                    session = uuid.uuid4().hex
+                    with server.lock:
+                        server.sessions.add(session)
+                    return self.reply("OK", headers={
+                        "Set-Cookie": f"sessid={session}; Path=/"})
+                return self.reply("ERROR")
+            if "upload_progress" in form:
+                upload = server.uploads.get(form.get("token"))
+                if not upload or not upload["size"]:
+                    return self.reply("")
+                return self.reply(json.dumps({
+                    "bytes_processed": upload["size"],
+                    "content_length": upload.get("length", upload["size"])}))
+            if "do_addjob" in form:
+                with server.lock:
+                    server.jobs.append(form)
+                    upload = server.uploads.get(form.get("token"))
+                    if upload and not server.reuse_tokens:
+                        upload["name"] = ""
+                return self.reply("OK")
+            return self.reply("", 404)
+
+        def receive_upload(self):
+            length = int(self.headers.get("Content-Length", 0))
+            content_type = self.headers.get("Content-Type", "")
+            boundary = content_type.partition("boundary=")[2].encode()
+            received = bytearray()
+            while len(received) < length:
+                chunk = self.rfile.read(min(65536, length - len(received)))
+                if not chunk:
+                    break
+                received += chunk
+            token = _form_value(received, boundary, b"token")
+            name = _form_filename(received, boundary)
+            with server.lock:
+                if token in server.uploads:
+                    server.uploads[token].update(
+                        size=len(received), length=length, name=name)
+            return self.reply("OK")
+
+    return Handler
+
+
+def _parts(body, boundary):
+    for part in body.split(b"--" + boundary):
+        headers, _, content = part.partition(b"\r\n\r\n")
+        yield headers, content[:-2]
+
+
+def _form_value(body, boundary, name):
+    for headers, content in _parts(body, boundary):
+        if b'name="' + name + b'"' in headers:
+            return content.decode("utf-8")
+    return None
+
+
+def _form_filename(body, boundary):
+    for headers, content in _parts(body, boundary):
+        if b'filename="' in headers:
+            return headers.split(b'filename="')[1].split(b'"')[0].decode()
+    return ""
+
+
+if __name__ == "__main__":
+    stub = StubServer(port=8080)
+    print(f"SheepIt stub server on http://127.0.0.1:{stub.port}")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        stub.httpd.server_close()
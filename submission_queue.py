@@ -0,0 +1,370 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import concurrent.futures
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from . import sheepit, worker
+
+
+# States of a queued project, in order
+PENDING = "pending"
+PREPARING = "preparing"
+PREPARED = "prepared"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+
+class SubmissionQueue():
+    """ Persistent queue submitting many projects
+
+        Projects are prepared in parallel, up to prepare_jobs Blender
+        processes at a time, and uploaded one after another as soon as the
+        server hands out a token. While the maximum number of simultaneous
+        projects is reached, the token is requested again with an
+        increasing delay.
+
+        The queue is stored in queue.json in its directory together with
+        a copy of every project, so it continues after a restart. """
+
+    def __init__(self, directory, blender_exe, prepare_jobs=2,
+                 token_delay=30, max_token_delay=600):
+        self.directory = directory
+        self.blender_exe = blender_exe
+        self.prepare_jobs = prepare_jobs
+        # waiting for a free project slot, jittered like other retries
+        self.token_policy = sheepit.RetryPolicy(
+            attempts=0, base=token_delay, cap=max_token_delay)
+        self.items = []
+        self.running = False
+        self.status = ""
+        self.session = None
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._cancel = sheepit.CancelToken()
+        # (finish time, uploaded bytes, upload seconds) of finished items
+        self._finished = []
+        self.load()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "queue.json")
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.items = data.get("items", [])
+            self.running = data.get("running", False)
+            # work interrupted by a restart is done again
+            for item in self.items:
+                if item["state"] == PREPARING:
+                    item["state"] = PENDING
+                elif item["state"] == UPLOADING:
+                    item["state"] = PREPARED
+
+    def save(self):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"items": self.items, "running": self.running},
+                          f, indent=1)
+            os.replace(temp_path, self.path)
+
+    def add(self, filepath, settings, name=None, copy=True,
+            use_max_ram=False):
+        """ Adds the project at filepath to the queue
+
+            settings are the keyword arguments for Sheepit.add_job().
+            The file is copied into the queue directory, unless copy is
+            False, then the queue takes ownership of filepath. Its paths
+            relative to the .blend file keep pointing into the directory
+            of filepath.
+            With use_max_ram the memory estimate of preparing the file
+            is sent as max_ram, if settings don't set one. """
+        id = uuid.uuid4().hex
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{id}.blend")
+        if copy:
+            shutil.copyfile(filepath, path)
+        else:
+            shutil.move(filepath, path)
+        item = {
+            "id": id,
+            "name": name or os.path.basename(filepath),
+            "path": path,
+            "directory": os.path.dirname(os.path.abspath(filepath)),
+            "settings": settings,
+            "state": PENDING,
+            "use_max_ram": use_max_ram,
+            "error": "",
+            "added": time.time(),
+        }
+        with self._lock:
+            self.items.append(item)
+            self.save()
+        self._wake.set()
+        return item
+
+    def add_prepared(self, filepath, chunks):
+        """ Adds an already prepared file as one project per chunk
+
+            chunks is a list of (settings, name). The file is moved into
+            the queue directory once and shared by all of its items, it
+            is removed when none of them is left. As this may copy a
+            large file, don't call it from Blender's main thread. """
+        id = uuid.uuid4().hex
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{id}.blend")
+        shutil.move(filepath, path)
+        items = [{
+            "id": f"{id}-{i}",
+            "name": name,
+            "path": path,
+            "settings": settings,
+            "state": PREPARED,
+            "prepared": True,
+            "error": "",
+            "added": time.time(),
+        } for i, (settings, name) in enumerate(chunks)]
+        with self._lock:
+            self.items.extend(items)
+            self.save()
+        self._wake.set()
+        return items
+
+    def _remove_unused(self, paths):
+        """ Removes the files of paths no item refers to anymore """
+        with self._lock:
+            used = {item["path"] for item in self.items}
+        for path in set(paths) - used:
+            worker.remove_files(path)
+
+    def remove_finished(self):
+        """ Removes done and failed items and their files """
+        with self._lock:
+            finished = [item for item in self.items
+                        if item["state"] in (DONE, FAILED)]
+            self.items = [item for item in self.items
+                          if item["state"] not in (DONE, FAILED)]
+            self.save()
+        self._remove_unused(item["path"] for item in finished)
+
+    def retry_failed(self):
+        with self._lock:
+            for item in self.items:
+                if item["state"] == FAILED:
+                    # a prepared file may be shared, don't prepare it again
+                    item["state"] = PREPARED if item.get("prepared") \
+                        else PENDING
+                    item["error"] = ""
+            self.save()
+        self._wake.set()
+
+    def start(self, session):
+        """ Starts working on the queue with a sheepit.Sheepit session """
+        with self._lock:
+            self.session = session
+            self.running = True
+            self.save()
+            self._stop.clear()
+            if self._cancel.cancelled:
+                self._cancel = sheepit.CancelToken()
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.prepare_jobs,
+                    thread_name_prefix="sheepit-prepare")
+            # a paused thread still finishing its upload just continues
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name="sheepit-queue",
+                                                daemon=True)
+                self._thread.start()
+
+    def pause(self):
+        """ Stops after the current upload, running prepares are
+            aborted and done again on the next start() """
+        with self._lock:
+            self.running = False
+            self.save()
+        self._stop.set()
+        self._wake.set()
+
+    def shutdown(self):
+        """ Stops the worker threads without waiting for them, running is
+            kept saved for the next start of Blender. A running upload is
+            cancelled and done again on the next start. """
+        self._stop.set()
+        self._cancel.cancel()
+        self._wake.set()
+        self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        """ Returns the queue depth, the items per state and throughput """
+        with self._lock:
+            counts = dict()
+            for item in self.items:
+                counts[item["state"]] = counts.get(item["state"], 0) + 1
+            finished = list(self._finished)
+        stats = {
+            "depth": sum(count for state, count in counts.items()
+                         if state not in (DONE, FAILED)),
+            "states": counts,
+            "projects_per_hour": 0.0,
+            "upload_rate": 0.0,
+            "retries": 0,
+        }
+        if self.session is not None:
+            stats["retries"] = sum(
+                counts["retries"] for endpoint, counts
+                in self.session.retry_stats().items() if endpoint != "budget")
+        hour_ago = time.time() - 3600
+        stats["projects_per_hour"] = float(
+            sum(1 for t, _, _ in finished if t > hour_ago))
+        upload_seconds = sum(seconds for _, _, seconds in finished)
+        if upload_seconds:
+            stats["upload_rate"] = sum(
+                size for _, size, _ in finished) / upload_seconds
+        return stats
+
+    def _set_state(self, item, state, error=""):
+        with self._lock:
+            item["state"] = state
+            item["error"] = error
+            self.save()
+
+    def _next(self, state):
+        with self._lock:
+            for item in self.items:
+                if item["state"] == state:
+                    return item
+        return None
+
+    def _run(self):
+        self._token_attempt = 0
+        while not self._stop.is_set():
+            try:
+                self._run_once()
+            except Exception as e:
+                # keep the thread alive, the item being uploaded failed
+                self.status = f"Error: {e}"
+                with self._lock:
+                    for item in self.items:
+                        if item["state"] == UPLOADING:
+                            self._set_state(item, FAILED, str(e))
+                self._stop.wait(1)
+
+    def _run_once(self):
+        self._schedule_prepares()
+        item = self._next(PREPARED)
+        if item is None:
+            self.status = "Preparing" if self._next(PREPARING) else "Idle"
+            self._wake.wait(1)
+            self._wake.clear()
+            return
+        try:
+            token = self.session.request_upload_token()
+        except (sheepit.UploadException, sheepit.NetworkException) as e:
+            delay = self.token_policy.delay(self._token_attempt)
+            self._token_attempt += 1
+            if isinstance(e, sheepit.UploadException):
+                # all project slots are used, try again later
+                self.status = ("Waiting for a free project slot, "
+                               f"next try in {delay:.0f}s")
+            else:
+                self.status = f"Network error: {e}"
+            self._stop.wait(delay)
+            return
+        self._token_attempt = 0
+        self._upload(item, token)
+
+    def _schedule_prepares(self):
+        with self._lock:
+            preparing = sum(1 for item in self.items
+                            if item["state"] == PREPARING)
+            changed = False
+            for item in self.items:
+                if preparing >= self.prepare_jobs:
+                    break
+                if item["state"] == PENDING:
+                    item["state"] = PREPARING
+                    preparing += 1
+                    self._executor.submit(self._prepare, item)
+                    changed = True
+            if changed:
+                self.save()
+
+    def _prepare(self, item):
+        try:
+            result = worker.prepare_in_subprocess(
+                self.blender_exe, item["path"], self._stop,
+                directory=item.get("directory"))
+        except OSError as e:
+            result = {"ok": False, "error": str(e)}
+        if result["ok"]:
+            with self._lock:
+                if item.get("use_max_ram") and \
+                        not item["settings"].get("max_ram"):
+                    item["settings"]["max_ram"] = \
+                        worker.max_ram_setting(result)
+                item["prepared"] = True
+            self._set_state(item, PREPARED)
+        elif self._stop.is_set():
+            self._set_state(item, PENDING)
+        else:
+            self._set_state(item, FAILED, result["error"])
+        self._wake.set()
+
+    def _upload(self, item, token):
+        self._set_state(item, UPLOADING)
+        self.status = f"Uploading {item['name']}"
+        start = time.monotonic()
+        try:
+            self.session.upload_file_resumable(token, item["path"],
+                                               cancel=self._cancel)
+            upload_seconds = time.monotonic() - start
+            self.status = f"Adding {item['name']}"
+            self.session.add_job(token, **item["settings"])
+        except sheepit.CancelledException:
+            self._set_state(item, PREPARED)
+            return
+        except (sheepit.NetworkException, sheepit.UploadException,
+                OSError) as e:
+            self._set_state(item, FAILED, str(e))
+            return
+        size = os.path.getsize(item["path"])
+        with self._lock:
+            self._finished.append((time.time(), size, upload_seconds))
+        with self._lock:
+            self._set_state(item, DONE)
+            # other chunks of the same file keep it
+            shared = any(other is not item and other["path"] == item["path"]
+                         for other in self.items)
+        if not shared:
+            worker.remove_files(item["path"])
@@ -0,0 +1,146 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import contextlib
+import json
+import threading
+import time
+
+
+# The trace of the last submission, used by the export operator
+last_trace = None
+
+
+class Stage():
+    """ One timed stage of a submission """
+
+    def __init__(self, name, category, start, thread):
+        self.name = name
+        # "disk", "blender" or "network"
+        self.category = category
+        self.start = start
+        self.end = None
+        self.thread = thread
+        self.bytes = 0
+        self.retries = 0
+        self.args = dict()
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Trace():
+    """ Records how long every stage of a submission took
+
+        Times are taken from a monotonic clock, stages may overlap and run
+        on different threads. The trace can be exported in the Chrome
+        trace event format (chrome://tracing or https://ui.perfetto.dev) """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name, category):
+        """ Times the enclosed code, the yielded Stage can be used
+            to record bytes moved, retries and other arguments """
+        stage = Stage(name, category, time.perf_counter(),
+                      threading.current_thread().name)
+        with self._lock:
+            self.stages.append(stage)
+        try:
+            yield stage
+        finally:
+            stage.end = time.perf_counter()
+
+    def add(self, name, category, start, duration, **args):
+        """ Adds a stage measured elsewhere, e.g. in another process """
+        stage = Stage(name, category, start, threading.current_thread().name)
+        stage.end = start + duration
+        stage.args.update(args)
+        with self._lock:
+            self.stages.append(stage)
+        return stage
+
+    def totals(self):
+        """ Returns the seconds spent per category
+
+            Nested stages of the same category are only counted once """
+        totals = dict()
+        for stage in self.stages:
+            if stage.args.get("nested"):
+                continue
+            totals[stage.category] = \
+                totals.get(stage.category, 0.0) + stage.duration
+        return totals
+
+    def summary(self):
+        """ Returns short lines describing the trace """
+        lines = []
+        total = time.perf_counter() - self.start
+        if self.stages:
+            total = max(s.start + s.duration for s in self.stages) \
+                - self.start
+        lines.append(f"Total {total:.1f}s: " + ", ".join(
+            f"{category} {seconds:.1f}s"
+            for category, seconds in sorted(
+                self.totals().items(), key=lambda item: -item[1])))
+        for stage in self.stages:
+            if stage.args.get("nested"):
+                continue
+            line = f"{stage.name}: {stage.duration:.2f}s"
+            if stage.bytes:
+                line += f", {stage.bytes / 1e6:.1f} MB"
+                if stage.duration > 0:
+                    line += f" ({stage.bytes / 1e6 / stage.duration:.1f} MB/s)"
+            if stage.retries:
+                line += f", {stage.retries} retries"
+            lines.append(line)
+        return lines
+
+    def to_chrome_trace(self):
+        """ Returns the trace as a Chrome trace event dict """
+        threads = dict()
+        events = []
+        for stage in self.stages:
+            tid = threads.setdefault(stage.thread, len(threads) + 1)
+            args = dict(stage.args)
+            args.pop("nested", None)
+            if stage.bytes:
+                args["bytes"] = stage.bytes
+            if stage.retries:
+                args["retries"] = stage.retries
+            events.append({
+                "name": stage.name,
+                "cat": stage.category,
+                "ph": "X",
+                "pid": 1,
+                "tid": tid,
+                "ts": (stage.start - self.start) * 1e6,
+                "dur": stage.duration * 1e6,
+                "args": args,
+            })
+        for thread, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1,
+                           "tid": tid, "args": {"name": thread}})
+        events.append({"name": "process_name", "ph": "M", "pid": 1,
+                       "args": {"name": self.name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
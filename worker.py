@@ -0,0 +1,270 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import secrets
+import select
+import socket
+import subprocess
+import threading
+import time
+
+
+PREPARE_SCRIPT = os.path.join(os.path.dirname(__file__), "prepare_scene.py")
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "prepare_worker.py")
+
+
+class WorkerException(Exception):
+    pass
+
+
+def read_log(filepath):
+    """ Reads the log written by prepare_scene.py for filepath
+
+        Returns the error text or an empty string on success
+        and the estimated render memory in bytes, 0 if unknown """
+    try:
+        with open(f"{filepath}.log", "r") as f:
+            output = f.read().split("<->")
+    except OSError:
+        return "Error opening log", 0
+    if len(output) == 0 or output[0] != "OK":
+        if len(output) > 1:
+            return output[1], 0
+        return "unknown error", 0
+    if len(output) > 1 and output[1].isdigit():
+        return "", int(output[1])
+    return "", 0
+
+
+def remove_files(filepath):
+    """ Removes a prepared file and everything written next to it """
+    for suffix in ("", ".log", "1", ".upload.json"):
+        try:
+            os.remove(f"{filepath}{suffix}")
+        except FileNotFoundError:
+            pass
+
+
+def max_ram_setting(result):
+    """ Returns the estimated memory of a prepare result in the
+        megabytes expected by Sheepit.add_job(), "" if unknown """
+    if not result.get("max_ram"):
+        return ""
+    return -(-result["max_ram"] // (1024 * 1024))
+
+
+def prepare_in_subprocess(blender_exe, filepath, abort=None, stdout=None,
+                          directory=None):
+    """ Prepares filepath in a new Blender process
+
+        abort is an optional threading.Event, setting it kills the process
+        stdout optionally redirects the output of Blender
+        directory is where filepath was copied from, its relative paths
+        are resolved from there
+        Returns a dict with "ok", "error", "seconds" and "max_ram" """
+    start = time.monotonic()
+    process = subprocess.Popen([
+        blender_exe,
+        filepath,
+        "--background",
+        "--factory-startup",
+        "--python",
+        PREPARE_SCRIPT
+    ] + (["--", directory] if directory else []), stdout=stdout)
+    if abort is None:
+        process.wait()
+    while process.poll() is None:
+        if abort.wait(0.1):
+            process.kill()
+            process.wait()
+            return {"ok": False, "error": "aborted",
+                    "seconds": time.monotonic() - start}
+    error, max_ram = read_log(filepath)
+    return {"ok": not error, "error": error,
+            "seconds": time.monotonic() - start, "max_ram": max_ram}
+
+
+class PrepareWorker():
+    """ A background Blender process preparing scenes
+
+        The process is started on the first prepare() and then kept
+        running, so later scenes skip Blender's startup. Jobs are sent
+        over a local socket and handled one at a time.
+
+        An aborted job can't be interrupted without killing the process
+        and the jobs of other callers, so its reply is ignored instead.
+        The process is only restarted if it doesn't reply within
+        hang_timeout seconds after the job was given up. """
+
+    hang_timeout = 300
+
+    def __init__(self, blender_exe, startup_timeout=60):
+        self.blender_exe = blender_exe
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.connection = None
+        self.stream = None
+        # when the running job was given up, None if there is none
+        self._abandoned = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _start(self):
+        key = secrets.token_hex(16)
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen(1)
+            listener.settimeout(self.startup_timeout)
+            port = listener.getsockname()[1]
+            self.process = subprocess.Popen([
+                self.blender_exe,
+                "--background",
+                "--factory-startup",
+                "--python",
+                WORKER_SCRIPT,
+                "--",
+                str(port),
+                key
+            ])
+            try:
+                connection, _ = listener.accept()
+            except socket.timeout:
+                self.stop()
+                raise WorkerException("Blender worker did not start")
+        connection.settimeout(None)
+        self.connection = connection
+        self.stream = connection.makefile("rwb")
+        if self.stream.readline().decode("utf-8").strip() != key:
+            self.stop()
+            raise WorkerException("Unknown process connected as worker")
+
+    def prepare(self, filepath, directory=None, abort=None):
+        """ Prepares filepath in the worker, starting it if needed
+
+            directory is where filepath was copied from, see
+            prepare_in_subprocess()
+            abort is an optional threading.Event, setting it skips the
+            job if it wasn't sent yet, or ignores its reply
+
+            Returns a dict with "ok", "error" and "seconds"
+            Raises:
+            WorkerException if the worker could not be started
+                or died while preparing """
+        aborted = {"ok": False, "error": "aborted", "seconds": 0.0}
+        while not self._lock.acquire(timeout=0.1):
+            if abort is not None and abort.is_set():
+                return aborted
+        try:
+            if self._abandoned is not None and \
+                    not self._skip_abandoned(abort):
+                return aborted
+            if abort is not None and abort.is_set():
+                return aborted
+            if not self.running:
+                self._start()
+            try:
+                request = json.dumps({"filepath": filepath,
+                                      "directory": directory})
+                self.stream.write(request.encode("utf-8") + b"\n")
+                self.stream.flush()
+                if not self._wait_reply(abort):
+                    self._abandoned = time.monotonic()
+                    return aborted
+                response = self.stream.readline()
+            except OSError:
+                response = b""
+            if not response:
+                self.stop()
+                raise WorkerException("Blender worker stopped unexpectedly")
+            return json.loads(response)
+        finally:
+            self._lock.release()
+
+    def _wait_reply(self, abort, timeout=None):
+        """ Waits until a reply can be read
+
+            Returns False if abort was set or timeout seconds passed """
+        start = time.monotonic()
+        while True:
+            if abort is not None and abort.is_set():
+                return False
+            if timeout is not None and time.monotonic() - start > timeout:
+                return False
+            readable, _, _ = select.select([self.connection], [], [], 0.1)
+            if readable or not self.running:
+                return True
+
+    def _skip_abandoned(self, abort):
+        """ Reads the reply of the given up job, a worker hanging for
+            hang_timeout is stopped
+
+            Returns False if abort was set while waiting """
+        timeout = max(0.0, self._abandoned + self.hang_timeout -
+                      time.monotonic())
+        try:
+            if self._wait_reply(abort, timeout):
+                self.stream.readline()
+            elif abort is not None and abort.is_set():
+                return False
+            else:
+                print("SheepIt: Blender worker hangs, restarting it")
+                self.stop()
+        except OSError:
+            self.stop()
+        self._abandoned = None
+        return True
+
+    def stop(self):
+        self._abandoned = None
+        if self.stream is not None:
+            try:
+                self.stream.close()
+                self.connection.close()
+            except OSError:
+                pass
+            self.stream = None
+            self.connection = None
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker(blender_exe):
+    """ Returns the shared PrepareWorker of this addon """
+    global _worker
+    with _worker_lock:
+        if _worker is None or _worker.blender_exe != blender_exe:
+            if _worker is not None:
+                _worker.stop()
+            _worker = PrepareWorker(blender_exe)
+        return _worker
+
+
+def stop_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+        _worker = None